@@ -0,0 +1,75 @@
+"""
+REST API benchmarks: routes called through TestClient by many threads at once.
+"""
+
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from benchutil import measure
+
+from fastapi.testclient import TestClient
+
+from src import flat_file_loader, main, passwords
+from src.async_repository import AsyncUserRepository
+from src.repository import UserRepository
+
+# Requests per measured round, and how many are in flight at once
+REQUESTS = 200
+CONCURRENCY = 16
+
+
+def _user(person_id):
+    return {
+        "person_id": person_id,
+        "first_name": "Anders",
+        "last_name": "Jensen",
+        "address": "Parkvej",
+        "street_number": "12",
+        "password": "hemmeligt123",
+        "enabled": True,
+    }
+
+
+def run(tmp_dir, iterations=3):
+    """
+    Run the API benchmarks against an empty JSON database in tmp_dir. Returns {name: result}.
+    bcrypt runs with 4 rounds here, the crypto suite measures the real cost.
+    """
+    flat_file_loader.STORAGE_BACKEND = "json"
+    flat_file_loader.FILE_FORMAT = "json"
+    flat_file_loader.DB_PATH = os.path.join(tmp_dir, "api-users.json")
+    flat_file_loader.CHANGES_PATH = os.path.join(tmp_dir, "api-users.changes.log")
+    main.repository = AsyncUserRepository(UserRepository())
+    rounds = passwords.crypto_utils.BCRYPT_ROUNDS
+    passwords.crypto_utils.BCRYPT_ROUNDS = 4
+    try:
+        return _run_routes(TestClient(main.app), iterations)
+    finally:
+        passwords.crypto_utils.BCRYPT_ROUNDS = rounds
+
+
+def _run_routes(client, iterations):
+    person_ids = itertools.count(1)
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        def run_all(request):
+            list(pool.map(lambda _: request(), range(REQUESTS)))
+
+        results["api.post_user"] = measure(
+            lambda: run_all(lambda: client.post("/users", json=_user(next(person_ids)))), iterations, batch=REQUESTS
+        )
+        results["api.get_user"] = measure(
+            lambda: run_all(lambda: client.get("/users/1")), iterations, batch=REQUESTS
+        )
+        results["api.list_users"] = measure(
+            lambda: run_all(lambda: client.get("/users", params={"limit": 50})), iterations, batch=REQUESTS
+        )
+        etag = client.get("/users", params={"limit": 50}).headers["etag"]
+        results["api.list_users_304"] = measure(
+            lambda: run_all(lambda: client.get("/users", params={"limit": 50}, headers={"If-None-Match": etag})),
+            iterations,
+            batch=REQUESTS,
+        )
+    return results
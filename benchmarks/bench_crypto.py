@@ -0,0 +1,38 @@
+"""
+crypto_utils benchmarks: bcrypt hashing/verification and Fernet encryption.
+"""
+
+from benchutil import measure
+
+import crypto_utils
+
+# Fernet operations per measured round
+ENCRYPT_BATCH = 1000
+
+
+def run(iterations=5):
+    """Run the crypto benchmarks. bcrypt uses crypto_utils.BCRYPT_ROUNDS. Returns {name: result}."""
+    results = {}
+    rounds = crypto_utils.BCRYPT_ROUNDS
+    hashed = crypto_utils.hash_password("hemmeligt123")
+
+    results[f"crypto.hash_password[rounds={rounds}]"] = measure(
+        lambda: crypto_utils.hash_password("hemmeligt123"), iterations
+    )
+    results[f"crypto.verify_password[rounds={rounds}]"] = measure(
+        lambda: crypto_utils.verify_password("hemmeligt123", hashed), iterations
+    )
+
+    key = crypto_utils.generate_key()
+    token = crypto_utils.encrypt_data("Parkvej 12, 4700 Næstved", key)
+    results["crypto.encrypt_data"] = measure(
+        lambda: [crypto_utils.encrypt_data("Parkvej 12, 4700 Næstved", key) for _ in range(ENCRYPT_BATCH)],
+        iterations,
+        batch=ENCRYPT_BATCH,
+    )
+    results["crypto.decrypt_data"] = measure(
+        lambda: [crypto_utils.decrypt_data(token, key) for _ in range(ENCRYPT_BATCH)],
+        iterations,
+        batch=ENCRYPT_BATCH,
+    )
+    return results
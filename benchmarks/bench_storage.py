@@ -0,0 +1,83 @@
+"""
+flat_file_db benchmarks: load, read_user, create_user and update_user
+on databases of different sizes.
+"""
+
+import itertools
+import os
+import random
+
+from benchutil import measure
+
+import flat_file_db
+import storage
+
+# A fixed bcrypt hash, so building a large database does not run bcrypt
+_PASSWORD_HASH = "$2b$04$b56u0A8TSyLA8BEjjShENuSUZLJKp1JbuajZn3/4Ll4qDJLIGImme"
+
+
+def _make_users(size):
+    return [
+        {
+            "person_id": str(i),
+            "first_name": "Anders",
+            "last_name": f"Jensen{i % 100}",
+            "address": "Parkvej",
+            "street_number": str(i % 200),
+            "password": _PASSWORD_HASH,
+            "enabled": True,
+        }
+        for i in range(size)
+    ]
+
+
+def _iterations(size, small):
+    """Many iterations on small databases, few on large ones (each write rewrites the file)."""
+    return max(3, min(small, 50_000 // size))
+
+
+def run(sizes, tmp_dir):
+    """
+    Run the storage benchmarks for each size. Returns {name: result}.
+    bcrypt runs with 4 rounds here, the crypto suite measures the real cost.
+    """
+    rounds = flat_file_db.crypto_utils.BCRYPT_ROUNDS
+    flat_file_db.crypto_utils.BCRYPT_ROUNDS = 4
+    flat_file_db.STORAGE_BACKEND = "json"
+    flat_file_db.JOURNAL_MODE = False
+    try:
+        return _run_sizes(sizes, tmp_dir)
+    finally:
+        flat_file_db.crypto_utils.BCRYPT_ROUNDS = rounds
+
+
+def _run_sizes(sizes, tmp_dir):
+    results = {}
+    rng = random.Random(42)
+
+    for size in sizes:
+        flat_file_db.DB_PATH = os.path.join(tmp_dir, f"users-{size}.json")
+        flat_file_db.CHANGES_PATH = os.path.join(tmp_dir, f"users-{size}.changes.log")
+        storage.FileStorage(flat_file_db.DB_PATH).replace_all(_make_users(size))
+        ids = [str(rng.randrange(size)) for _ in range(1000)]
+
+        def cold_load():
+            flat_file_db._cache["stamp"] = None
+            flat_file_db._load_db()
+
+        results[f"storage.load[{size}]"] = measure(cold_load, _iterations(size, 10))
+        results[f"storage.read_user[{size}]"] = measure(
+            lambda: [flat_file_db.read_user(pid) for pid in ids], 20, batch=len(ids)
+        )
+
+        new_ids = (f"new-{i}" for i in itertools.count())
+        results[f"storage.create_user[{size}]"] = measure(
+            lambda: flat_file_db.create_user(next(new_ids), "Bo", "Hansen", "Skovvej", "3", "hemmeligt123"),
+            _iterations(size, 50),
+        )
+        update_ids = itertools.cycle(ids)
+        results[f"storage.update_user[{size}]"] = measure(
+            lambda: flat_file_db.update_user(next(update_ids), address="Skovvej"),
+            _iterations(size, 50),
+        )
+    return results
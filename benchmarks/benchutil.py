@@ -0,0 +1,92 @@
+"""
+Timing and baseline helpers shared by the benchmark modules.
+"""
+
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Where the project folders are, so the benchmarks can import them
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "flat-file-db", "src"))
+sys.path.insert(0, os.path.join(ROOT, "crypto-hashing", "src"))
+sys.path.insert(0, os.path.join(ROOT, "rest-api"))
+
+
+# ──────────────────────────────────────────────
+# TIMING
+# ──────────────────────────────────────────────
+
+def measure(func, iterations, batch=1):
+    """
+    Call func() iterations times and time each call.
+    func does batch operations per call; the result is per operation:
+    {"iterations", "batch", "median_s", "mean_s", "min_s", "ops_per_s"}.
+    """
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) / batch)
+    median = statistics.median(times)
+    return {
+        "iterations": iterations,
+        "batch": batch,
+        "median_s": median,
+        "mean_s": statistics.mean(times),
+        "min_s": min(times),
+        "ops_per_s": 1 / median if median else float("inf"),
+    }
+
+
+# ──────────────────────────────────────────────
+# BASELINES
+# ──────────────────────────────────────────────
+
+def environment():
+    """Describe the machine, stored next to the results (baselines are machine specific)."""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def load_results(path):
+    """Load a results/baseline file. Returns {} if it does not exist."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_results(path, results):
+    """Write results with the environment to a JSON file."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare median times with a baseline.
+    Returns a list of (name, baseline_s, current_s, change) for the benchmarks
+    in both, where change is the relative difference (0.10 = 10% slower),
+    and the list of names that regressed by more than threshold.
+    """
+    rows = []
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        before = baseline[name]["median_s"]
+        after = results[name]["median_s"]
+        change = (after - before) / before if before else 0.0
+        rows.append((name, before, after, change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
@@ -0,0 +1,89 @@
+"""
+Run the benchmark suite and compare it with the stored baseline.
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py                    # everything, compare with baseline.json
+    python benchmarks/run_benchmarks.py --quick            # 1k users only, fewer iterations
+    python benchmarks/run_benchmarks.py --suite crypto     # one suite
+    python benchmarks/run_benchmarks.py --save-baseline    # store the results as the new baseline
+
+Exits with status 1 if a benchmark is more than --threshold slower than the baseline.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+
+import benchutil
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+SUITES = ("storage", "api", "crypto")
+
+# Number of users in the storage benchmarks
+SIZES = (1_000, 100_000, 1_000_000)
+
+
+def run_suites(suites, sizes, quick):
+    """Run the selected suites in a temp folder. Returns {name: result}."""
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="user-bench-") as tmp_dir:
+        if "storage" in suites:
+            import bench_storage
+            results.update(bench_storage.run(sizes, tmp_dir))
+        if "api" in suites:
+            import bench_api
+            results.update(bench_api.run(tmp_dir, iterations=1 if quick else 3))
+        if "crypto" in suites:
+            import bench_crypto
+            results.update(bench_crypto.run(iterations=2 if quick else 5))
+    return results
+
+
+def print_report(results, rows, regressions, threshold):
+    """Print every result and, where there is a baseline, the change."""
+    changes = {name: (before, change) for name, before, _, change in rows}
+    print(f"{'benchmark':<42} {'median':>12} {'ops/s':>12} {'baseline':>12} {'change':>8}")
+    for name in sorted(results):
+        result = results[name]
+        line = f"{name:<42} {result['median_s'] * 1000:>10.3f}ms {result['ops_per_s']:>12.1f}"
+        if name in changes:
+            before, change = changes[name]
+            flag = "  REGRESSION" if name in regressions else ""
+            line += f" {before * 1000:>10.3f}ms {change:>+7.1%}{flag}"
+        print(line)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) are more than {threshold:.0%} slower than the baseline.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite.")
+    parser.add_argument("--suite", nargs="+", choices=SUITES, default=list(SUITES), help="suites to run")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES), help="database sizes for storage")
+    parser.add_argument("--quick", action="store_true", help="1k users only and fewer iterations")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    sizes = [1_000] if args.quick else args.sizes
+    results = run_suites(args.suite, sizes, args.quick)
+
+    baseline = benchutil.load_results(args.baseline).get("results", {})
+    rows, regressions = benchutil.compare(results, baseline, args.threshold)
+    print_report(results, rows, regressions, args.threshold)
+
+    if args.output:
+        benchutil.save_results(args.output, results)
+    if args.save_baseline:
+        # Keep baseline entries for benchmarks that were not run this time
+        benchutil.save_results(args.baseline, dict(baseline, **results))
+        print(f"\nBaseline saved: {args.baseline}")
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
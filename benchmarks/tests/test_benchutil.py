@@ -0,0 +1,64 @@
+"""
+Tests for the benchmark helpers (benchutil.py).
+
+Uses Given / When / Then comments to describe each test scenario.
+"""
+
+import os
+import sys
+
+# Add the benchmarks folder to the path so we can import benchutil
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import benchutil
+
+
+def result(median_s):
+    return {"median_s": median_s}
+
+
+# ──────────────────────────────────────────────
+# TEST: Regressions beyond the threshold are reported
+# ──────────────────────────────────────────────
+def test_compare_flags_only_regressions_beyond_threshold():
+    """
+    GIVEN: A baseline and results that are faster, a bit slower, much slower or new
+    WHEN:  They are compared with a 25% threshold
+    THEN:  Only the much slower benchmark is a regression, and the new one is not compared
+    """
+    # Given
+    baseline = {"fast": result(1.0), "bit_slower": result(1.0), "much_slower": result(1.0)}
+    results = {"fast": result(0.5), "bit_slower": result(1.2), "much_slower": result(1.5), "new": result(1.0)}
+
+    # When
+    rows, regressions = benchutil.compare(results, baseline, threshold=0.25)
+
+    # Then
+    assert regressions == ["much_slower"]
+    assert [row[0] for row in rows] == ["bit_slower", "fast", "much_slower"]
+    assert rows[2][3] == 0.5
+
+
+# ──────────────────────────────────────────────
+# TEST: Results round-trip through a baseline file
+# ──────────────────────────────────────────────
+def test_measure_and_save_results(tmp_path):
+    """
+    GIVEN: A function that does 10 operations per call
+    WHEN:  It is measured and the result is saved and loaded again
+    THEN:  The result is per operation and the file holds the environment
+    """
+    # Given
+    calls = []
+
+    # When
+    measured = benchutil.measure(lambda: calls.append(1), iterations=3, batch=10)
+    path = str(tmp_path / "baseline.json")
+    benchutil.save_results(path, {"noop": measured})
+    loaded = benchutil.load_results(path)
+
+    # Then
+    assert len(calls) == 3
+    assert measured["iterations"] == 3 and measured["batch"] == 10
+    assert loaded["results"]["noop"] == measured
+    assert "python" in loaded["environment"]
@@ -3,10 +3,28 @@ Crypto utilities for password hashing and personal data encryption.
 
 - Passwords are HASHED (one-way) using bcrypt.
 - Personal data is ENCRYPTED (two-way) using Fernet (AES-128-CBC).
+
+The public functions are timed with metrics.timed (off unless USER_METRICS=1).
 """
 
+import asyncio
+import functools
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import secrets
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import bcrypt
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
+
+import metrics
 
 
 # ──────────────────────────────────────────────
@@ -18,16 +36,64 @@ def generate_key():
     return Fernet.generate_key()
 
 
+# Number of keys whose cipher objects are kept in the LRU cache
+CIPHER_CACHE_SIZE = 32
+
+
+class DataCipher:
+    """
+    Fernet cipher for one key, working on strings.
+    Build it once per key and reuse it, so each call only pays for the AES work.
+    """
+
+    def __init__(self, key):
+        self.fernet = Fernet(key)
+
+    def encrypt(self, plaintext):
+        """Encrypt a plaintext string. Returns the encrypted bytes as a string."""
+        return self.fernet.encrypt(plaintext.encode("utf-8")).decode("utf-8")
+
+    def decrypt(self, encrypted_text):
+        """Decrypt an encrypted string. Returns the original plaintext string."""
+        return self.fernet.decrypt(encrypted_text.encode("utf-8")).decode("utf-8")
+
+
+@functools.lru_cache(maxsize=CIPHER_CACHE_SIZE)
+def get_cipher(key):
+    """Return a cached DataCipher for key (bytes or str)."""
+    return DataCipher(key)
+
+
+def _cipher_cache_metrics():
+    """Hit/miss counts of the cipher LRU cache, for metrics.render()."""
+    info = get_cipher.cache_info()
+    return [
+        ("cache_requests_total", {"cache": "cipher", "result": "hit"}, info.hits),
+        ("cache_requests_total", {"cache": "cipher", "result": "miss"}, info.misses),
+    ]
+
+
+metrics.register_collector(_cipher_cache_metrics)
+
+
+def clear_cipher_cache():
+    """
+    Drop all cached ciphers.
+    Call this after destroying a key (crypto-shredding), so it is not kept in memory.
+    """
+    get_cipher.cache_clear()
+
+
+@metrics.timed("encrypt_data")
 def encrypt_data(plaintext, key):
     """
     Encrypt a plaintext string using Fernet (AES-128-CBC).
     Returns the encrypted bytes as a string.
     """
-    f = Fernet(key)
-    encrypted = f.encrypt(plaintext.encode("utf-8"))
-    return encrypted.decode("utf-8")
+    return get_cipher(key).encrypt(plaintext)
 
 
+@metrics.timed("decrypt_data")
 def decrypt_data(encrypted_text, key):
     """
     Decrypt an encrypted string using Fernet.
@@ -36,28 +102,247 @@ def decrypt_data(encrypted_text, key):
     After use, the caller should delete the decrypted value
     from memory as soon as possible (del variable).
     """
-    f = Fernet(key)
-    decrypted = f.decrypt(encrypted_text.encode("utf-8"))
-    return decrypted.decode("utf-8")
+    return get_cipher(key).decrypt(encrypted_text)
+
+
+# ──────────────────────────────────────────────
+# BATCH ENCRYPTION (whole user records)
+# ──────────────────────────────────────────────
+
+# Default number of records per chunk when running in parallel
+RECORD_CHUNK_SIZE = 1000
+
+
+def _transform_record(record, fields, func):
+    """Return a copy of record with func applied to each of the given fields that is present."""
+    result = dict(record)
+    for field in fields:
+        value = result.get(field)
+        if value is not None:
+            result[field] = func(value)
+    return result
+
+
+def _encrypt_chunk(records, fields, key):
+    """Encrypt fields in a list of records with one cipher (also used in worker processes)."""
+    encrypt = get_cipher(key).encrypt
+    return [_transform_record(record, fields, encrypt) for record in records]
+
+
+def _decrypt_chunk(records, fields, key):
+    """Decrypt fields in a list of records with one cipher (also used in worker processes)."""
+    decrypt = get_cipher(key).decrypt
+    return [_transform_record(record, fields, decrypt) for record in records]
+
+
+def _chunks(records, chunk_size):
+    """Split an iterable of records into lists of at most chunk_size."""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _process_records(chunk_func, records, fields, key, workers, chunk_size):
+    """Run chunk_func over records, optionally across a process pool. Returns a list."""
+    fields = tuple(fields)
+    if not workers or workers <= 1:
+        return chunk_func(list(records), fields, key)
+
+    result = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunks = _chunks(records, chunk_size)
+        for chunk in pool.map(chunk_func, chunks, itertools.repeat(fields), itertools.repeat(key)):
+            result.extend(chunk)
+    return result
+
+
+@metrics.timed("encrypt_records")
+def encrypt_records(records, fields, key, workers=None, chunk_size=RECORD_CHUNK_SIZE):
+    """
+    Encrypt the given fields (e.g. ["address", "street_number"]) in a list of user dicts.
+    Returns new dicts; the input records are not changed.
+    Fields that are missing or None are left as they are.
+
+    With workers > 1 the records are split into chunks of chunk_size and
+    encrypted in parallel in a process pool.
+    """
+    return _process_records(_encrypt_chunk, records, fields, key, workers, chunk_size)
+
+
+@metrics.timed("decrypt_records")
+def decrypt_records(records, fields, key, workers=None, chunk_size=RECORD_CHUNK_SIZE):
+    """
+    Decrypt the given fields in a list of user dicts (the reverse of encrypt_records).
+    Returns new dicts; the input records are not changed.
+    """
+    return _process_records(_decrypt_chunk, records, fields, key, workers, chunk_size)
+
+
+def iter_encrypt_records(records, fields, key):
+    """Generator version of encrypt_records, for streaming large exports one record at a time."""
+    encrypt = get_cipher(key).encrypt
+    fields = tuple(fields)
+    for record in records:
+        yield _transform_record(record, fields, encrypt)
+
+
+def iter_decrypt_records(records, fields, key):
+    """Generator version of decrypt_records."""
+    decrypt = get_cipher(key).decrypt
+    fields = tuple(fields)
+    for record in records:
+        yield _transform_record(record, fields, decrypt)
+
+
+# ──────────────────────────────────────────────
+# KEY ROTATION
+# ──────────────────────────────────────────────
+
+class KeyRing:
+    """
+    A list of keys, newest first, built on MultiFernet.
+    Encrypts with the newest key and decrypts with any of them, so old
+    data stays readable while it is being re-encrypted.
+    """
+
+    def __init__(self, keys):
+        if not keys:
+            raise ValueError("KeyRing needs at least one key.")
+        self.keys = list(keys)
+        self.multi = MultiFernet([Fernet(key) for key in self.keys])
+
+    def encrypt(self, plaintext):
+        """Encrypt a plaintext string with the newest key."""
+        return self.multi.encrypt(plaintext.encode("utf-8")).decode("utf-8")
+
+    def decrypt(self, encrypted_text):
+        """Decrypt a string that was encrypted with any key in the ring."""
+        return self.multi.decrypt(encrypted_text.encode("utf-8")).decode("utf-8")
+
+    def rotate(self, encrypted_text):
+        """Re-encrypt a string with the newest key (without exposing the plaintext)."""
+        return self.multi.rotate(encrypted_text.encode("utf-8")).decode("utf-8")
+
+
+@metrics.timed("rotate_records")
+def rotate_records(records, fields, key_ring):
+    """Return copies of records with the given fields re-encrypted with the newest key."""
+    return [_transform_record(record, fields, key_ring.rotate) for record in records]
+
+
+class KeyRotationJob:
+    """
+    Resumable re-encryption of stored records in small batches.
+
+    The job does not know the storage. It is given two functions:
+    - fetch_batch(after_id, limit): the next `limit` records with id > after_id,
+      sorted by id (after_id is None for the first batch)
+    - save_batch(records): store the re-encrypted records
+
+    After each batch the last id is written to checkpoint_path, so a stopped
+    or crashed job continues where it left off. Only one batch is handled at
+    a time, so the rest of the data stays available while the job runs.
+    """
+
+    def __init__(self, key_ring, fields, fetch_batch, save_batch, checkpoint_path,
+                 batch_size=100, id_field="person_id"):
+        self.key_ring = key_ring
+        self.fields = tuple(fields)
+        self.fetch_batch = fetch_batch
+        self.save_batch = save_batch
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.id_field = id_field
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read_checkpoint(self):
+        """Return the saved checkpoint dict, or a fresh one."""
+        if not os.path.exists(self.checkpoint_path):
+            return {"last_id": None, "done": False, "count": 0}
+        with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_checkpoint(self, checkpoint):
+        """Save the checkpoint atomically (temp file + os.replace)."""
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    @property
+    def done(self):
+        """True when every record has been re-encrypted."""
+        return self._read_checkpoint()["done"]
+
+    def run(self, max_batches=None):
+        """
+        Re-encrypt batches until all records are done, stop() is called
+        or max_batches batches have been handled.
+        Returns the number of records re-encrypted in this call.
+        """
+        checkpoint = self._read_checkpoint()
+        handled = 0
+        batches = 0
+        while not checkpoint["done"] and not self._stop.is_set():
+            if max_batches is not None and batches >= max_batches:
+                break
+            batch = self.fetch_batch(checkpoint["last_id"], self.batch_size)
+            if not batch:
+                checkpoint["done"] = True
+            else:
+                self.save_batch(rotate_records(batch, self.fields, self.key_ring))
+                checkpoint["last_id"] = batch[-1][self.id_field]
+                checkpoint["count"] += len(batch)
+                handled += len(batch)
+            self._write_checkpoint(checkpoint)
+            batches += 1
+        return handled
+
+    def start(self):
+        """Run the job in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ask the background thread to stop after the current batch and wait for it."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
 
 
 # ──────────────────────────────────────────────
 # HASHING (for passwords)
 # ──────────────────────────────────────────────
 
-def hash_password(plaintext_password):
+# bcrypt cost factor (log2 of the number of rounds) used for new hashes.
+# Use calibrate_bcrypt_rounds() to pick a value that fits the host.
+BCRYPT_ROUNDS = 12
+
+
+@metrics.timed("hash_password")
+def hash_password(plaintext_password, rounds=None):
     """
     Hash a plaintext password using bcrypt.
     Returns the hashed password as a string.
 
     bcrypt automatically generates a salt and includes it in the hash.
+    rounds defaults to BCRYPT_ROUNDS.
     """
     password_bytes = plaintext_password.encode("utf-8")
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode("utf-8")
 
 
+@metrics.timed("verify_password")
 def verify_password(plaintext_password, hashed_password):
     """
     Verify a plaintext password against a bcrypt hash.
@@ -66,3 +351,254 @@ def verify_password(plaintext_password, hashed_password):
     password_bytes = plaintext_password.encode("utf-8")
     hashed_bytes = hashed_password.encode("utf-8")
     return bcrypt.checkpw(password_bytes, hashed_bytes)
+
+
+# rounds -> hash of a random password, used by verify_dummy_password()
+_dummy_hashes = {}
+
+
+def verify_dummy_password(plaintext_password, rounds=None):
+    """
+    Run bcrypt against a fixed dummy hash with cost rounds (default BCRYPT_ROUNDS) and return False.
+    Call it when a login is rejected before the real check (unknown or disabled
+    user), so that answer takes as long as a wrong password and does not reveal
+    which users exist.
+    """
+    rounds = rounds or BCRYPT_ROUNDS
+    dummy = _dummy_hashes.get(rounds)
+    if dummy is None:
+        dummy = _dummy_hashes[rounds] = hash_password(secrets.token_urlsafe(16), rounds)
+    verify_password(plaintext_password, dummy)
+    return False
+
+
+def is_password_hash(value):
+    """True if value looks like a bcrypt hash (used to find plaintext passwords to migrate)."""
+    return isinstance(value, str) and value.startswith(("$2a$", "$2b$", "$2y$")) and len(value) == 60
+
+
+def get_hash_rounds(hashed_password):
+    """Return the cost factor stored in a bcrypt hash ("$2b$12$..." -> 12)."""
+    return int(hashed_password.split("$")[2])
+
+
+def needs_rehash(hashed_password):
+    """True if the hash was made with a lower cost than BCRYPT_ROUNDS."""
+    return get_hash_rounds(hashed_password) < BCRYPT_ROUNDS
+
+
+def verify_and_update(plaintext_password, hashed_password):
+    """
+    Verify a password and upgrade its hash if the cost is too low.
+    Returns (ok, new_hash). new_hash is None unless the password matched and
+    the stored hash needs a rehash; the caller should then store new_hash.
+    This upgrades hashes lazily on successful login, without a bulk job.
+    """
+    if not verify_password_cached(plaintext_password, hashed_password):
+        return False, None
+    if needs_rehash(hashed_password):
+        invalidate_verify_cache(hashed_password)
+        return True, hash_password(plaintext_password)
+    return True, None
+
+
+def calibrate_bcrypt_rounds(target_ms=250, min_rounds=10, max_rounds=16, apply=False):
+    """
+    Benchmark bcrypt on this host and return the highest cost whose hash time
+    fits within target_ms (never lower than min_rounds).
+    With apply=True the result is also stored in BCRYPT_ROUNDS.
+    """
+    global BCRYPT_ROUNDS
+
+    password = b"calibration-password"
+    best = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        start = time.perf_counter()
+        bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > target_ms:
+            break
+        best = rounds
+        # Each extra round doubles the time, so stop if the next one cannot fit
+        if elapsed_ms * 2 > target_ms:
+            break
+
+    if apply:
+        BCRYPT_ROUNDS = best
+    return best
+
+
+# ──────────────────────────────────────────────
+# VERIFIED-PASSWORD CACHE (optional)
+# ──────────────────────────────────────────────
+
+# Off by default. When on, successful verifications are remembered for a short
+# time, so repeated logins (retries, basic-auth on every request) skip bcrypt.
+VERIFY_CACHE_ENABLED = False
+VERIFY_CACHE_SIZE = 1024
+VERIFY_CACHE_TTL = 60  # seconds
+
+# Entries are keyed by HMACs with a random per-process secret, so neither the
+# password nor the hash is kept in the cache:
+#   HMAC(hash) -> (HMAC(hash + password), expires_at)
+# A hash has only one correct password, so one entry per hash is enough.
+_verify_cache = OrderedDict()
+_verify_cache_lock = threading.Lock()
+_verify_cache_secret = secrets.token_bytes(32)
+
+
+def _mac(*parts):
+    """Keyed HMAC-SHA256 over the parts (separated by a zero byte)."""
+    message = b"\0".join(part.encode("utf-8") for part in parts)
+    return hmac.new(_verify_cache_secret, message, hashlib.sha256).digest()
+
+
+def _verify_cache_hit(plaintext_password, hashed_password):
+    """True if this password was verified against this hash within the TTL."""
+    hash_id = _mac(hashed_password)
+    with _verify_cache_lock:
+        entry = _verify_cache.get(hash_id)
+        if entry is None:
+            return False
+        password_mac, expires_at = entry
+        if expires_at < time.monotonic():
+            del _verify_cache[hash_id]
+            return False
+        if not hmac.compare_digest(password_mac, _mac(hashed_password, plaintext_password)):
+            return False
+        _verify_cache.move_to_end(hash_id)
+        return True
+
+
+def _verify_cache_store(plaintext_password, hashed_password):
+    """Remember a successful verification, evicting the oldest entry when full."""
+    hash_id = _mac(hashed_password)
+    entry = (_mac(hashed_password, plaintext_password), time.monotonic() + VERIFY_CACHE_TTL)
+    with _verify_cache_lock:
+        _verify_cache[hash_id] = entry
+        _verify_cache.move_to_end(hash_id)
+        while len(_verify_cache) > VERIFY_CACHE_SIZE:
+            _verify_cache.popitem(last=False)
+
+
+def invalidate_verify_cache(hashed_password=None):
+    """
+    Forget cached verifications for one hash, or all of them if no hash is given.
+    Call this whenever a stored password hash is changed or removed.
+    """
+    with _verify_cache_lock:
+        if hashed_password is None:
+            _verify_cache.clear()
+        else:
+            _verify_cache.pop(_mac(hashed_password), None)
+
+
+@metrics.timed("verify_password_cached")
+def verify_password_cached(plaintext_password, hashed_password):
+    """
+    verify_password with the optional verified-password cache in front.
+    Only successful verifications are cached; wrong passwords always run bcrypt.
+    """
+    if not VERIFY_CACHE_ENABLED:
+        return verify_password(plaintext_password, hashed_password)
+    hit = _verify_cache_hit(plaintext_password, hashed_password)
+    metrics.record_cache("verify_password", hit)
+    if hit:
+        return True
+    ok = verify_password(plaintext_password, hashed_password)
+    if ok:
+        _verify_cache_store(plaintext_password, hashed_password)
+    return ok
+
+
+# ──────────────────────────────────────────────
+# ASYNC HASHING (bounded worker pool)
+# ──────────────────────────────────────────────
+
+# bcrypt releases the GIL, so a thread pool lets hashes run in parallel
+# on all cores without blocking the event loop.
+HASH_WORKERS = os.cpu_count() or 1
+
+# Max number of hash jobs waiting for a free worker. When the queue is full,
+# new callers wait (backpressure) instead of piling up unbounded work.
+HASH_QUEUE_SIZE = 64
+
+_hash_pool = {"executor": None, "limit": None, "semaphores": weakref.WeakKeyDictionary()}
+
+
+def configure_hash_pool(workers=None, queue_size=None, use_processes=False):
+    """
+    (Re)create the worker pool used by hash_password_async / verify_password_async.
+    workers defaults to HASH_WORKERS and queue_size to HASH_QUEUE_SIZE.
+    Set use_processes=True to use a process pool instead of threads.
+    """
+    shutdown_hash_pool()
+    workers = workers or HASH_WORKERS
+    queue_size = HASH_QUEUE_SIZE if queue_size is None else queue_size
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    _hash_pool["executor"] = executor_class(max_workers=workers)
+    _hash_pool["limit"] = workers + queue_size
+    _hash_pool["semaphores"] = weakref.WeakKeyDictionary()
+
+
+def _get_hash_executor():
+    """Return the worker pool, creating it with the default settings if needed."""
+    if _hash_pool["executor"] is None:
+        configure_hash_pool()
+    return _hash_pool["executor"]
+
+
+def shutdown_hash_pool():
+    """Stop the worker pool (it is created again on next use)."""
+    if _hash_pool["executor"] is not None:
+        _hash_pool["executor"].shutdown(wait=True)
+    _hash_pool["executor"] = None
+
+
+async def _run_in_hash_pool(func, *args):
+    """Run func(*args) in the worker pool, waiting for a free slot if the queue is full."""
+    executor = _get_hash_executor()
+
+    # One semaphore per event loop, since asyncio primitives belong to a loop
+    loop = asyncio.get_running_loop()
+    semaphore = _hash_pool["semaphores"].get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(_hash_pool["limit"])
+        _hash_pool["semaphores"][loop] = semaphore
+
+    async with semaphore:
+        return await loop.run_in_executor(executor, func, *args)
+
+
+@metrics.timed("hash_passwords")
+def hash_passwords(plaintext_passwords):
+    """
+    Hash many passwords in parallel in the worker pool (blocking call).
+    Returns the hashes in the same order. Used for batch imports and migrations.
+    """
+    # rounds is passed explicitly so a process pool uses this process's BCRYPT_ROUNDS
+    rounds = itertools.repeat(BCRYPT_ROUNDS)
+    return list(_get_hash_executor().map(hash_password, plaintext_passwords, rounds))
+
+
+@metrics.timed("hash_password_async")
+async def hash_password_async(plaintext_password):
+    """Async version of hash_password that runs bcrypt in the worker pool."""
+    return await _run_in_hash_pool(hash_password, plaintext_password, BCRYPT_ROUNDS)
+
+
+@metrics.timed("verify_password_async")
+async def verify_password_async(plaintext_password, hashed_password):
+    """
+    Async version of verify_password that runs bcrypt in the worker pool.
+    A hit in the verified-password cache is answered without using the pool.
+    """
+    if VERIFY_CACHE_ENABLED and _verify_cache_hit(plaintext_password, hashed_password):
+        metrics.record_cache("verify_password", True)
+        return True
+    return await _run_in_hash_pool(verify_password_cached, plaintext_password, hashed_password)
+
+
+async def verify_dummy_password_async(plaintext_password):
+    """Async version of verify_dummy_password that runs bcrypt in the worker pool."""
+    return await _run_in_hash_pool(verify_dummy_password, plaintext_password, BCRYPT_ROUNDS)
@@ -0,0 +1,176 @@
+"""
+Lightweight in-process metrics: latency histograms, counters and a
+Prometheus text export.
+
+Shared by crypto_utils.py, flat-file-db and the rest-api (they already
+have crypto-hashing/src on sys.path). Off by default: when disabled, a
+timed function costs one extra call and one flag check. Turn it on with
+the environment variable USER_METRICS=1 or enable().
+"""
+
+import asyncio
+import functools
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("USER_METRICS", "") == "1"
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = "userdb_"
+
+_HELP = {
+    "operation_duration_seconds": "Time spent in an instrumented function.",
+    "http_request_duration_seconds": "Time to handle an HTTP request, by route.",
+    "storage_bytes_total": "Bytes read from and written to snapshot files.",
+    "cache_requests_total": "Cache lookups by cache and result (hit/miss).",
+}
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+_counters = {}  # (name, labels) -> value
+_collectors = []
+
+
+def enable(enabled=True):
+    """Turn metric collection on or off."""
+    global ENABLED
+    ENABLED = enabled
+
+
+def reset():
+    """Forget every recorded value."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+# ──────────────────────────────────────────────
+# RECORDING
+# ──────────────────────────────────────────────
+
+def observe(name, seconds, **labels):
+    """Add one observation to histogram name."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(BUCKETS)] += 1
+        histogram[-1] += seconds
+
+
+def inc(name, value=1, **labels):
+    """Add value to counter name."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup, so the hit rate is hit / (hit + miss)."""
+    if ENABLED:
+        inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+
+def record_bytes(direction, count):
+    """Count bytes read ("read") or written ("write") by the storage layer."""
+    if ENABLED:
+        inc("storage_bytes_total", count, direction=direction)
+
+
+def register_collector(collector):
+    """
+    Register a function called by render(). It returns (name, labels, value)
+    tuples for counters it keeps itself (e.g. functools.lru_cache statistics).
+    """
+    _collectors.append(collector)
+
+
+def timed(operation):
+    """
+    Decorator that records the duration of each call in the
+    operation_duration_seconds histogram. Works on sync and async functions.
+    """
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return await func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    observe("operation_duration_seconds", time.perf_counter() - start, operation=operation)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe("operation_duration_seconds", time.perf_counter() - start, operation=operation)
+        return wrapper
+    return decorate
+
+
+# ──────────────────────────────────────────────
+# PROMETHEUS EXPORT
+# ──────────────────────────────────────────────
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Return every metric in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        histograms = {key: list(values) for key, values in _histograms.items()}
+        counters = dict(_counters)
+    for collector in _collectors:
+        for name, labels, value in collector():
+            counters[(name, tuple(sorted(labels.items())))] = value
+
+    lines = []
+    for name in sorted({key[0] for key in histograms}):
+        lines.append(f"# HELP {PREFIX}{name} {_HELP.get(name, name)}")
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), values):
+                cumulative += count
+                le = bound if bound == "+Inf" else repr(bound)
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {_format_value(values[-1])}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {cumulative}")
+
+    for name in sorted({key[0] for key in counters}):
+        lines.append(f"# HELP {PREFIX}{name} {_HELP.get(name, name)}")
+        lines.append(f"# TYPE {PREFIX}{name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{PREFIX}{name}{_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -5,6 +5,7 @@ Tests password hashing (bcrypt) and data encryption (Fernet/AES).
 Uses Given / When / Then comments to describe each test scenario.
 """
 
+import asyncio
 import os
 import sys
 import pytest
@@ -74,6 +75,102 @@ def test_verify_wrong_password():
     assert result is False
 
 
+# ──────────────────────────────────────────────
+# TEST: Weak hashes are upgraded on login
+# ──────────────────────────────────────────────
+def test_verify_and_update_rehashes_low_cost_hash(monkeypatch):
+    """
+    GIVEN: A password hashed with cost 4 while the target cost is 5
+    WHEN:  The correct password is verified with verify_and_update
+    THEN:  It matches and a new hash with cost 5 is returned;
+           verifying the new hash returns no further rehash
+    """
+    # Given
+    monkeypatch.setattr(crypto_utils, "BCRYPT_ROUNDS", 5)
+    old_hash = crypto_utils.hash_password("SuperHemmeligt123", rounds=4)
+
+    # When
+    ok, new_hash = crypto_utils.verify_and_update("SuperHemmeligt123", old_hash)
+
+    # Then
+    assert ok is True
+    assert crypto_utils.get_hash_rounds(new_hash) == 5
+    assert crypto_utils.verify_and_update("SuperHemmeligt123", new_hash) == (True, None)
+    assert crypto_utils.verify_and_update("ForkertPassword", old_hash) == (False, None)
+
+
+# ──────────────────────────────────────────────
+# TEST: Dummy verification for rejected logins
+# ──────────────────────────────────────────────
+def test_verify_dummy_password_uses_current_cost(monkeypatch):
+    """
+    GIVEN: The target cost is 5
+    WHEN:  verify_dummy_password is called
+    THEN:  It returns False after checking a dummy hash with cost 5
+    """
+    # Given
+    monkeypatch.setattr(crypto_utils, "BCRYPT_ROUNDS", 5)
+    checked = []
+    verify = crypto_utils.verify_password
+    monkeypatch.setattr(crypto_utils, "verify_password", lambda p, h: checked.append(h) or verify(p, h))
+
+    # When
+    result = crypto_utils.verify_dummy_password("SuperHemmeligt123")
+
+    # Then
+    assert result is False
+    assert [crypto_utils.get_hash_rounds(h) for h in checked] == [5]
+
+
+# ──────────────────────────────────────────────
+# TEST: Cost calibration respects the latency budget
+# ──────────────────────────────────────────────
+def test_calibrate_bcrypt_rounds_stays_in_range():
+    """
+    GIVEN: A latency budget of 0.01 ms (too small for any real cost)
+    WHEN:  bcrypt is calibrated between cost 4 and 6
+    THEN:  The lowest allowed cost is returned
+    """
+    # When
+    rounds = crypto_utils.calibrate_bcrypt_rounds(target_ms=0.01, min_rounds=4, max_rounds=6)
+
+    # Then
+    assert rounds == 4
+
+
+# ──────────────────────────────────────────────
+# TEST: Verified-password cache
+# ──────────────────────────────────────────────
+def test_verify_cache_skips_bcrypt_until_invalidated(monkeypatch):
+    """
+    GIVEN: The verified-password cache is enabled and a password was verified once
+    WHEN:  The same password is verified again, a wrong one is tried,
+           and the hash is then invalidated
+    THEN:  The repeat skips bcrypt, the wrong password still fails,
+           and after invalidation bcrypt runs again
+    """
+    # Given
+    monkeypatch.setattr(crypto_utils, "VERIFY_CACHE_ENABLED", True)
+    crypto_utils.invalidate_verify_cache()
+    hashed = crypto_utils.hash_password("SuperHemmeligt123", rounds=4)
+    assert crypto_utils.verify_password_cached("SuperHemmeligt123", hashed) is True
+
+    calls = []
+    original = crypto_utils.verify_password
+    monkeypatch.setattr(crypto_utils, "verify_password", lambda p, h: calls.append(1) or original(p, h))
+
+    # When / Then
+    assert crypto_utils.verify_password_cached("SuperHemmeligt123", hashed) is True
+    assert calls == []
+
+    assert crypto_utils.verify_password_cached("ForkertPassword", hashed) is False
+    assert calls == [1]
+
+    crypto_utils.invalidate_verify_cache(hashed)
+    assert crypto_utils.verify_password_cached("SuperHemmeligt123", hashed) is True
+    assert calls == [1, 1]
+
+
 # ──────────────────────────────────────────────
 # TEST: Encrypt and decrypt data
 # ──────────────────────────────────────────────
@@ -136,6 +233,133 @@ def test_decrypt_with_wrong_key_fails():
         crypto_utils.decrypt_data(encrypted, key2)
 
 
+# ──────────────────────────────────────────────
+# TEST: Cipher objects are reused per key
+# ──────────────────────────────────────────────
+def test_cipher_is_cached_per_key():
+    """
+    GIVEN: Two different encryption keys
+    WHEN:  We ask for a cipher for each key twice
+    THEN:  The same key gives the same cipher object, different keys do not,
+           and data encrypted with the cipher decrypts with decrypt_data
+    """
+    # Given
+    key1 = crypto_utils.generate_key()
+    key2 = crypto_utils.generate_key()
+
+    # When
+    cipher = crypto_utils.get_cipher(key1)
+
+    # Then
+    assert crypto_utils.get_cipher(key1) is cipher
+    assert crypto_utils.get_cipher(key2) is not cipher
+    encrypted = cipher.encrypt("Parkvej 12")
+    assert crypto_utils.decrypt_data(encrypted, key1) == "Parkvej 12"
+
+
+# ──────────────────────────────────────────────
+# TEST: Encrypt and decrypt whole user records
+# ──────────────────────────────────────────────
+@pytest.mark.parametrize("workers", [None, 2])
+def test_encrypt_and_decrypt_records(workers):
+    """
+    GIVEN: A list of user records and a field spec
+    WHEN:  The records are encrypted and decrypted in bulk (serial and in a process pool)
+    THEN:  Only the listed fields are encrypted, and decrypting gives the original records
+    """
+    # Given
+    key = crypto_utils.generate_key()
+    fields = ["address", "street_number"]
+    users = [
+        {"person_id": str(i), "first_name": "Anders", "address": "Parkvej", "street_number": str(i)}
+        for i in range(25)
+    ]
+
+    # When
+    encrypted = crypto_utils.encrypt_records(users, fields, key, workers=workers, chunk_size=10)
+    decrypted = crypto_utils.decrypt_records(encrypted, fields, key, workers=workers, chunk_size=10)
+
+    # Then
+    assert all(u["address"] != "Parkvej" for u in encrypted)
+    assert all(u["first_name"] == "Anders" for u in encrypted)
+    assert decrypted == users
+    assert list(crypto_utils.iter_decrypt_records(encrypted, fields, key)) == users
+
+
+# ──────────────────────────────────────────────
+# TEST: Key rotation in resumable batches
+# ──────────────────────────────────────────────
+def test_key_rotation_job_resumes_from_checkpoint(tmp_path):
+    """
+    GIVEN: 25 records encrypted with an old key and a key ring with a new key in front
+    WHEN:  The rotation job runs 2 batches of 10, is recreated, and runs to the end
+    THEN:  Every record can be decrypted with the new key alone
+    """
+    # Given
+    old_key = crypto_utils.generate_key()
+    new_key = crypto_utils.generate_key()
+    store = {
+        i: {"person_id": i, "address": crypto_utils.encrypt_data(f"Parkvej {i}", old_key)}
+        for i in range(25)
+    }
+
+    def fetch_batch(after_id, limit):
+        ids = sorted(i for i in store if after_id is None or i > after_id)
+        return [store[i] for i in ids[:limit]]
+
+    def save_batch(records):
+        for record in records:
+            store[record["person_id"]] = record
+
+    ring = crypto_utils.KeyRing([new_key, old_key])
+    checkpoint = str(tmp_path / "rotation.json")
+
+    def make_job():
+        return crypto_utils.KeyRotationJob(ring, ["address"], fetch_batch, save_batch,
+                                           checkpoint, batch_size=10)
+
+    # When
+    assert make_job().run(max_batches=2) == 20
+    assert make_job().run() == 5
+
+    # Then
+    assert make_job().done
+    for i, record in store.items():
+        assert crypto_utils.decrypt_data(record["address"], new_key) == f"Parkvej {i}"
+
+
+# ──────────────────────────────────────────────
+# TEST: Async hashing in the worker pool
+# ──────────────────────────────────────────────
+def test_hash_and_verify_password_async():
+    """
+    GIVEN: A small worker pool with a queue of 1
+    WHEN:  Several passwords are hashed and verified concurrently with the async API
+    THEN:  Every hash verifies against its own password and not against a wrong one
+    """
+    # Given
+    crypto_utils.configure_hash_pool(workers=2, queue_size=1)
+    passwords = [f"Password{i}" for i in range(5)]
+
+    async def run():
+        hashes = await asyncio.gather(*(crypto_utils.hash_password_async(p) for p in passwords))
+        right = await asyncio.gather(*(
+            crypto_utils.verify_password_async(p, h) for p, h in zip(passwords, hashes)
+        ))
+        wrong = await crypto_utils.verify_password_async("ForkertPassword", hashes[0])
+        return right, wrong
+
+    # When
+    try:
+        right, wrong = asyncio.run(run())
+    finally:
+        crypto_utils.shutdown_hash_pool()
+
+    # Then
+    assert all(right)
+    assert wrong is False
+
+
 # ──────────────────────────────────────────────
 # TEST: Intentionally FAILING test
 # ──────────────────────────────────────────────
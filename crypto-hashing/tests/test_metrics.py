@@ -0,0 +1,78 @@
+"""
+Tests for metrics.py (histograms, counters and the Prometheus export).
+
+Uses Given / When / Then comments to describe each test scenario.
+"""
+
+import os
+import sys
+import pytest
+
+# Add the src folder to the path so we can import metrics
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import crypto_utils
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics(monkeypatch):
+    """Start every test with no recorded values and metrics enabled."""
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+# ──────────────────────────────────────────────
+# TEST: Histogram buckets in the Prometheus export
+# ──────────────────────────────────────────────
+def test_histogram_is_exported_cumulatively():
+    """
+    GIVEN: Three observations of 0.3 ms, 3 ms and 20 s
+    WHEN:  The metrics are rendered
+    THEN:  The buckets are cumulative, +Inf holds all three and the sum is correct
+    """
+    # Given
+    for seconds in (0.0003, 0.003, 20.0):
+        metrics.observe("operation_duration_seconds", seconds, operation="demo")
+
+    # When
+    text = metrics.render()
+
+    # Then
+    assert "# TYPE userdb_operation_duration_seconds histogram" in text
+    assert 'userdb_operation_duration_seconds_bucket{operation="demo",le="0.0005"} 1' in text
+    assert 'userdb_operation_duration_seconds_bucket{operation="demo",le="0.005"} 2' in text
+    assert 'userdb_operation_duration_seconds_bucket{operation="demo",le="10.0"} 2' in text
+    assert 'userdb_operation_duration_seconds_bucket{operation="demo",le="+Inf"} 3' in text
+    assert 'userdb_operation_duration_seconds_count{operation="demo"} 3' in text
+    assert 'userdb_operation_duration_seconds_sum{operation="demo"} 20.0033' in text
+
+
+# ──────────────────────────────────────────────
+# TEST: crypto_utils functions are timed, and nothing is recorded when disabled
+# ──────────────────────────────────────────────
+def test_crypto_functions_are_timed_only_when_enabled(monkeypatch):
+    """
+    GIVEN: A key and a bcrypt hash
+    WHEN:  encrypt_data and verify_password run with metrics enabled, then again disabled
+    THEN:  Only the enabled calls are counted, and cipher cache hits are exported
+    """
+    # Given
+    key = crypto_utils.generate_key()
+    hashed = crypto_utils.hash_password("hemmeligt123", rounds=4)
+    metrics.reset()
+
+    # When
+    crypto_utils.encrypt_data("Parkvej", key)
+    crypto_utils.encrypt_data("Parkvej", key)
+    crypto_utils.verify_password("hemmeligt123", hashed)
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    crypto_utils.encrypt_data("Parkvej", key)
+    text = metrics.render()
+
+    # Then
+    assert 'userdb_operation_duration_seconds_count{operation="encrypt_data"} 2' in text
+    assert 'userdb_operation_duration_seconds_count{operation="verify_password"} 1' in text
+    assert 'userdb_cache_requests_total{cache="cipher",result="hit"}' in text
@@ -0,0 +1,176 @@
+"""
+Change feed (change data capture) for user mutations.
+
+Every write appends one JSON line per changed user to a change log:
+
+    {"seq": 17, "op": "update", "person_id": "1", "user": {...}, "time": 1700000000.0}
+
+op is "create", "update", "delete", "enable" or "disable". seq is a
+sequence number that only grows, also across processes (the append runs
+under a file lock), so a consumer stores the last seq it has seen and asks
+for everything after it. The user is stored without the password.
+
+Both flat_file_db.py and the rest-api write to a ChangeLog and read from it.
+"""
+
+import bisect
+import json
+import threading
+import time
+
+import storage
+
+# The log is scanned in blocks of this size, so a large log is never read into memory at once
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def classify(old, new):
+    """
+    Return the op for a change from old to new (user dicts, old None for a new user).
+    A change of only enabled is "enable"/"disable"; anything else is "update".
+    """
+    if old is None:
+        return "create"
+    changed = {field for field in new if field != "password" and old.get(field) != new[field]}
+    if changed == {"enabled"}:
+        return "enable" if new["enabled"] else "disable"
+    return "update"
+
+
+def public_user(user):
+    """The user without the password, as stored in the change log."""
+    return {field: value for field, value in user.items() if field != "password"}
+
+
+class ChangeLog:
+    """
+    An append-only JSON-lines change log.
+    The byte offset of each entry is kept in memory (by seq), and only the
+    part of the file that was appended since the last read is scanned.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, inode):
+        self._inode = inode
+        self._size = 0
+        self._seqs = []
+        self._offsets = []
+
+    def _catch_up(self):
+        """Index the entries appended since the last call (must hold self.lock)."""
+        stamp = storage.stat_stamp(self.path)
+        if stamp is None:
+            self._reset(None)
+            return
+        _, _, size, inode = stamp
+        if inode != self._inode or size < self._size:
+            self._reset(inode)
+        if size == self._size:
+            return
+
+        position = self._size
+        remaining = size - self._size
+        pending = b""
+        with open(self.path, "rb") as f:
+            f.seek(position)
+            while remaining > 0:
+                block = f.read(min(READ_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                remaining -= len(block)
+                data = pending + block
+                # Only complete lines; a line that is still being written is read next time
+                end = data.rfind(b"\n") + 1
+                for line in data[:end].splitlines(keepends=True):
+                    try:
+                        seq = json.loads(line)["seq"]
+                    except (ValueError, KeyError, TypeError):
+                        seq = None  # a line cut off by a crash
+                    if seq is not None and (not self._seqs or seq > self._seqs[-1]):
+                        self._seqs.append(seq)
+                        self._offsets.append(position)
+                    position += len(line)
+                pending = data[end:]
+        self._size = position
+
+    def last_seq(self):
+        """The seq of the newest entry, or 0 if the log is empty."""
+        with self.lock:
+            self._catch_up()
+            return self._seqs[-1] if self._seqs else 0
+
+    def append(self, changes):
+        """
+        Append changes, a list of (op, user) pairs, and return the new entries.
+        Runs under a lock file, so concurrent writers get unique, increasing seqs.
+        """
+        if not changes:
+            return []
+        with self.lock, storage.file_lock(self.path + ".lock"):
+            self._catch_up()
+            seq = self._seqs[-1] if self._seqs else 0
+            now = time.time()
+            entries = []
+            for op, user in changes:
+                seq += 1
+                entries.append({
+                    "seq": seq,
+                    "op": op,
+                    "person_id": user["person_id"],
+                    "user": public_user(user),
+                    "time": now,
+                })
+            data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+            with open(self.path, "a", encoding="utf-8") as f:
+                # Start on a fresh line if a crash left half a line at the end
+                if f.tell() > self._size:
+                    data = "\n" + data
+                f.write(data)
+            self._catch_up()
+        return entries
+
+    def read(self, since=0, limit=None):
+        """Return the entries with seq > since (at most limit), oldest first."""
+        with self.lock:
+            self._catch_up()
+            start = bisect.bisect_right(self._seqs, since)
+            stop = len(self._seqs) if limit is None else min(len(self._seqs), start + limit)
+            if start >= stop:
+                return []
+            offset = self._offsets[start]
+            end = self._offsets[stop] if stop < len(self._offsets) else self._size
+
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read(end - offset)
+        entries = []
+        for line in data.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("seq", 0) > since:
+                entries.append(entry)
+        return entries[:limit] if limit is not None else entries
+
+    def follow(self, since=0, poll_interval=0.1, timeout=None):
+        """
+        Generator over the entries after since. When it has caught up it
+        waits for new entries (polling the file), until timeout seconds pass
+        without a new entry (None = forever).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            entries = self.read(since)
+            for entry in entries:
+                since = entry["seq"]
+                yield entry
+            if entries and timeout is not None:
+                deadline = time.monotonic() + timeout
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            time.sleep(poll_interval)
@@ -0,0 +1,31 @@
+"""
+Convert a user database file between formats.
+
+Usage (from the flat-file-db folder):
+    python src/convert_db.py db/users.json db/users.udb --format binary
+    python src/convert_db.py db/users.udb db/users.json --format json
+    python src/convert_db.py db/users.json db/users.udx --format indexed
+
+The source format is detected automatically.
+"""
+
+import argparse
+
+import file_format
+import storage
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a user database file between formats.")
+    parser.add_argument("source", help="file to read (any format)")
+    parser.add_argument("target", help="file to write")
+    parser.add_argument("--format", choices=file_format.FORMATS, default="json", help="format of the target file")
+    parser.add_argument("--indent", type=int, default=2, help="indent for the json format")
+    args = parser.parse_args(argv)
+
+    count = storage.convert_file(args.source, args.target, args.format, args.indent)
+    print(f"Converted {count} user(s) to {args.format}: {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+On-disk formats for a user snapshot.
+
+- "json":     pretty-printed JSON (the original format, easy to read and diff)
+- "json-min": minified JSON, written and parsed with orjson when it is installed
+- "binary":   compact column format for the fixed user fields (see below)
+- "indexed":  one record after the other plus a sorted offset index, made
+              to be memory-mapped and decoded one record at a time
+              (see mapped_store.py)
+
+decode() detects the format from the first bytes, so a loader can read any
+of them without being told which one it is.
+
+Binary layout (little-endian):
+
+    b"UDB1" | count: uint32 | id_kind: uint8 (0 = int ids, 1 = str ids)
+    person_id column: count * int64           (int ids)
+                      uint64 length + blob     (str ids)
+    one column per string field: uint64 length + utf-8 blob
+    enabled column: count bytes (0/1)
+
+A string column is all values joined with NUL, so decoding is one
+bytes.decode() and one str.split() per column, both done in C.
+"""
+
+import gc
+import json
+import struct
+import sys
+from array import array
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib json module is used without it
+    orjson = None
+
+FORMATS = ("json", "json-min", "binary", "indexed")
+
+MAGIC = b"UDB1"
+_HEADER = struct.Struct("<4sIB")
+_LENGTH = struct.Struct("<Q")
+
+INDEXED_MAGIC = b"UDX1"
+# magic | count | offset of the index
+INDEXED_HEADER = struct.Struct("<4sIQ")
+# id_is_int | enabled | byte length of person_id and each string field
+RECORD_HEADER = struct.Struct("<BB6I")
+
+_STRING_FIELDS = ("first_name", "last_name", "address", "street_number", "password")
+
+
+# ──────────────────────────────────────────────
+# JSON
+# ──────────────────────────────────────────────
+
+def _encode_json(users, indent):
+    """Pretty JSON, exactly as json.dump writes it."""
+    return json.dumps(users, indent=indent, ensure_ascii=False).encode("utf-8")
+
+
+def _encode_json_min(users):
+    """Minified JSON, using orjson if available."""
+    if orjson is not None:
+        return orjson.dumps(users)
+    return json.dumps(users, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _decode_json(data):
+    """Parse JSON bytes, using orjson if available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode("utf-8"))
+
+
+# ──────────────────────────────────────────────
+# BINARY
+# ──────────────────────────────────────────────
+
+def _join_column(values, field):
+    """Join string values with NUL. Raises ValueError if a value contains NUL."""
+    blob = "\0".join(values)
+    if blob.count("\0") != max(len(values) - 1, 0):
+        raise ValueError(f"Field '{field}' contains a NUL character and cannot be stored in binary format.")
+    data = blob.encode("utf-8")
+    return _LENGTH.pack(len(data)) + data
+
+
+def _encode_binary(users):
+    """Encode users in the binary column format."""
+    ids = [user["person_id"] for user in users]
+    int_ids = all(type(pid) is int for pid in ids)
+    if not int_ids and not all(type(pid) is str for pid in ids):
+        # The id column is either all ints or all strings; anything else would come back changed
+        raise ValueError("person_id must be all int or all str to be stored in binary format.")
+
+    parts = [_HEADER.pack(MAGIC, len(users), 0 if int_ids else 1)]
+    if int_ids:
+        column = array("q", ids)
+        if sys.byteorder == "big":
+            column.byteswap()
+        parts.append(column.tobytes())
+    else:
+        parts.append(_join_column(ids, "person_id"))
+    for field in _STRING_FIELDS:
+        parts.append(_join_column([user[field] for user in users], field))
+    parts.append(bytes(1 if user["enabled"] else 0 for user in users))
+    return b"".join(parts)
+
+
+def _read_column(data, offset, count):
+    """Read one NUL-joined string column. Returns (values, new offset)."""
+    (length,) = _LENGTH.unpack_from(data, offset)
+    offset += _LENGTH.size
+    blob = data[offset:offset + length].decode("utf-8")
+    values = blob.split("\0") if count else []
+    return values, offset + length
+
+
+def _decode_binary(data):
+    """Decode the binary column format to a list of user dicts."""
+    _, count, id_kind = _HEADER.unpack_from(data, 0)
+    offset = _HEADER.size
+
+    if id_kind == 0:
+        ids = array("q")
+        ids.frombytes(data[offset:offset + 8 * count])
+        if sys.byteorder == "big":
+            ids.byteswap()
+        ids = ids.tolist()
+        offset += 8 * count
+    else:
+        ids, offset = _read_column(data, offset, count)
+
+    columns = [ids]
+    for _ in _STRING_FIELDS:
+        values, offset = _read_column(data, offset, count)
+        columns.append(values)
+    columns.append([b == 1 for b in data[offset:offset + count]])
+
+    # A dict display is about twice as fast as dict(zip(fields, row)).
+    # The garbage collector is paused while a million dicts are allocated.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return [
+            {
+                "person_id": person_id,
+                "first_name": first_name,
+                "last_name": last_name,
+                "address": address,
+                "street_number": street_number,
+                "password": password,
+                "enabled": enabled,
+            }
+            for person_id, first_name, last_name, address, street_number, password, enabled in zip(*columns)
+        ]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+# ──────────────────────────────────────────────
+# INDEXED (row format with an offset index)
+# ──────────────────────────────────────────────
+#
+#   b"UDX1" | count: uint32 | index_offset: uint64
+#   records: RECORD_HEADER + person_id + string fields (utf-8), one after the other
+#   index at index_offset: count * uint64 record offsets, sorted by id_sort_key
+
+def id_sort_key(person_id):
+    """Sort key that orders int and str person_ids without comparing them directly."""
+    return (0, person_id, "") if type(person_id) is int else (1, 0, person_id)
+
+
+def encode_record(user):
+    """Encode one user as RECORD_HEADER followed by its utf-8 fields."""
+    person_id = user["person_id"]
+    parts = [str(person_id).encode("utf-8")] + [user[field].encode("utf-8") for field in _STRING_FIELDS]
+    header = RECORD_HEADER.pack(type(person_id) is int, bool(user["enabled"]), *(len(p) for p in parts))
+    return header + b"".join(parts)
+
+
+def decode_record(data, offset):
+    """Decode the record at offset. Returns a tuple in USER_FIELDS order."""
+    header = RECORD_HEADER.unpack_from(data, offset)
+    id_is_int, enabled, lengths = header[0], header[1], header[2:]
+    position = offset + RECORD_HEADER.size
+    values = []
+    for length in lengths:
+        values.append(data[position:position + length].decode("utf-8"))
+        position += length
+    person_id = int(values[0]) if id_is_int else values[0]
+    return (person_id,) + tuple(values[1:]) + (enabled == 1,)
+
+
+def decode_record_id(data, offset):
+    """Decode only the person_id of the record at offset (for binary search)."""
+    header = RECORD_HEADER.unpack_from(data, offset)
+    start = offset + RECORD_HEADER.size
+    raw = data[start:start + header[2]].decode("utf-8")
+    return int(raw) if header[0] else raw
+
+
+def _encode_indexed(users):
+    """Encode users as records plus a sorted offset index."""
+    parts = []
+    offsets = []
+    position = INDEXED_HEADER.size
+    for user in users:
+        record = encode_record(user)
+        offsets.append((id_sort_key(user["person_id"]), position))
+        parts.append(record)
+        position += len(record)
+
+    index = array("Q", [offset for _, offset in sorted(offsets)])
+    if sys.byteorder == "big":
+        index.byteswap()
+    header = INDEXED_HEADER.pack(INDEXED_MAGIC, len(users), position)
+    return header + b"".join(parts) + index.tobytes()
+
+
+def _decode_indexed(data):
+    """Decode every record of the indexed format, in file (insertion) order."""
+    _, count, index_offset = INDEXED_HEADER.unpack_from(data, 0)
+    fields = ("person_id",) + _STRING_FIELDS + ("enabled",)
+    users = []
+    offset = INDEXED_HEADER.size
+    while offset < index_offset:
+        users.append(dict(zip(fields, decode_record(data, offset))))
+        lengths = RECORD_HEADER.unpack_from(data, offset)[2:]
+        offset += RECORD_HEADER.size + sum(lengths)
+    return users
+
+
+# ──────────────────────────────────────────────
+# PUBLIC API
+# ──────────────────────────────────────────────
+
+def detect(data):
+    """Return the format name of snapshot bytes ("binary", "indexed" or "json")."""
+    if data.startswith(MAGIC):
+        return "binary"
+    if data.startswith(INDEXED_MAGIC):
+        return "indexed"
+    return "json"
+
+
+def encode(users, file_format="json", indent=2):
+    """Encode a list of user dicts as bytes in the given format."""
+    if file_format == "binary":
+        return _encode_binary(users)
+    if file_format == "indexed":
+        return _encode_indexed(users)
+    if file_format == "json-min":
+        return _encode_json_min(users)
+    if file_format == "json":
+        return _encode_json(users, indent)
+    raise ValueError(f"Unknown file format: '{file_format}'")
+
+
+def decode(data):
+    """Decode snapshot bytes in any supported format (auto-detected)."""
+    detected = detect(data)
+    if detected == "binary":
+        return _decode_binary(data)
+    if detected == "indexed":
+        return _decode_indexed(data)
+    if not data or data.isspace():
+        return []
+    return _decode_json(data)
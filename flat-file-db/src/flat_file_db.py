@@ -1,44 +1,288 @@
 """
 Flat file database using JSON for user storage.
 Supports: create, read, update, enable/disable users.
+Passwords are stored as bcrypt hashes (see crypto-hashing/src/crypto_utils.py).
+
+The file format itself lives in storage.py, which also has a sharded and a
+SQLite backend (set STORAGE_BACKEND = "sharded" or "sqlite").
 """
 
 import json
 import os
+import sys
+
+# crypto_utils lives in the crypto-hashing assignment
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "crypto-hashing", "src"))
+
+import changes
+import crypto_utils
+import indexes
+import metrics
+import storage
+
+# Storage backend: "json" (DB_PATH), "sharded" (SHARD_PATH) or "sqlite" (SQLITE_PATH)
+STORAGE_BACKEND = "json"
 
 # Path to the JSON database file
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "db", "users.json")
 
+# Format used when DB_PATH is written: "json" (indent=2), "json-min" or "binary".
+# Reading detects the format, so this can be changed at any time.
+SNAPSHOT_FORMAT = "json"
+
+# Folder with the shard files, and the number of shards used when it is created.
+# Change the count of an existing folder with src/reshard_db.py.
+SHARD_PATH = os.path.join(os.path.dirname(__file__), "..", "db", "users-shards")
+SHARD_COUNT = 4
+
+# Path to the SQLite database file
+SQLITE_PATH = os.path.join(os.path.dirname(__file__), "..", "db", "users.db")
+
+# Journal mode (JSON backend only): when True, writes are appended as JSON
+# lines to a log file next to DB_PATH instead of rewriting the whole snapshot.
+JOURNAL_MODE = False
+
+# The journal is folded back into the snapshot once it grows past this size.
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+# Change feed: when True, every create/update/enable/disable is appended to
+# CHANGES_PATH with a sequence number, read with iter_changes() (see changes.py).
+# Off by default: the log is never truncated, so it grows with every write.
+CHANGE_FEED = False
+CHANGES_PATH = os.path.join(os.path.dirname(__file__), "..", "db", "users.changes.log")
+
+# Fields with a secondary index, used by find_users()
+INDEXED_FIELDS = ("enabled", "last_name", "first_name")
+# Indexed fields that also support prefix queries (string fields)
+PREFIX_FIELDS = ("last_name", "first_name")
+
+
+# ──────────────────────────────────────────────
+# IN-MEMORY STORE
+# ──────────────────────────────────────────────
+
+# The parsed user list is kept in memory together with a person_id -> user
+# index and the secondary indexes (field -> indexes.SecondaryIndex).
+# The storage is only read again if its stamp changes, i.e. if something
+# outside this process has written to it.
+_cache = {"stamp": None, "users": [], "index": {}, "secondary": {}}
+
+# Open storage backends, keyed by (backend, path, pid)
+_storages = {}
+
+# Open change logs, keyed by path
+_change_logs = {}
+
+
+def _storage():
+    """Return the storage backend selected by STORAGE_BACKEND."""
+    if STORAGE_BACKEND == "sqlite":
+        key, options = ("sqlite", SQLITE_PATH), {}
+    elif STORAGE_BACKEND == "sharded":
+        key, options = ("sharded", SHARD_PATH), {"shards": SHARD_COUNT, "indent": 2, "file_format": SNAPSHOT_FORMAT}
+    else:
+        key, options = ("json", DB_PATH), {"indent": 2, "file_format": SNAPSHOT_FORMAT}
+    # Keyed by pid too: a forked worker must not reuse its parent's SQLite connection
+    cache_key = key + tuple(options.values()) + (os.getpid(),)
+    if cache_key not in _storages:
+        _storages[cache_key] = storage.open_storage(*key, **options)
+    return _storages[cache_key]
+
+
+def _change_log():
+    """Return the ChangeLog for CHANGES_PATH."""
+    if CHANGES_PATH not in _change_logs:
+        _change_logs[CHANGES_PATH] = changes.ChangeLog(CHANGES_PATH)
+    return _change_logs[CHANGES_PATH]
+
+
+def _uses_journal():
+    """The journal only exists for the JSON backend."""
+    return STORAGE_BACKEND == "json"
+
+
+def _journal_path():
+    """Path to the append-only journal that belongs to DB_PATH."""
+    return DB_PATH + ".log"
+
+
+def _file_stamp():
+    """Return a stamp for the storage (and journal), or None if nothing exists yet."""
+    snapshot = _storage().stamp()
+    journal = storage.stat_stamp(_journal_path()) if _uses_journal() else None
+    if snapshot is None and journal is None:
+        return None
+    return (snapshot, journal)
+
+
+def _read_snapshot():
+    """Load all users from the storage backend. Returns a list of user dicts."""
+    return _storage().load_all()
+
+
+def _replay_journal(users):
+    """
+    Apply the journal entries on top of the snapshot users.
+    Lines that cannot be parsed (a crash in the middle of an append) are skipped.
+    """
+    path = _journal_path()
+    if not _uses_journal() or not os.path.exists(path):
+        return users
+
+    index = {user["person_id"]: user for user in users}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            record = entry["user"]
+            existing = index.get(record["person_id"])
+            if existing is None:
+                users.append(record)
+                index[record["person_id"]] = record
+            else:
+                existing.clear()
+                existing.update(record)
+    return users
 
+
+def _read_file():
+    """Read the snapshot and replay the journal. Returns a list of user dicts."""
+    return _replay_journal(_read_snapshot())
+
+
+def _set_cache(users, stamp):
+    """Replace the cached user list and rebuild the person_id index."""
+    _cache["users"] = users
+    _cache["index"] = {user["person_id"]: user for user in users}
+    _cache["secondary"] = indexes.build_indexes(INDEXED_FIELDS, users, PREFIX_FIELDS)
+    _cache["stamp"] = stamp
+
+
+@metrics.timed("flat_file_db._load_db")
 def _load_db():
-    """Load users from the JSON file. Returns a list of user dicts."""
-    if not os.path.exists(DB_PATH):
-        return []
-    with open(DB_PATH, "r", encoding="utf-8") as f:
-        data = f.read().strip()
-        if not data:
-            return []
-        return json.loads(data)
+    """
+    Return the cached list of user dicts.
+    The JSON file is only read if it has changed since the last load.
+    """
+    stamp = _file_stamp()
+    hit = stamp is not None and stamp == _cache["stamp"]
+    metrics.record_cache("flat_file_db", hit)
+    if not hit:
+        _set_cache(_read_file(), stamp)
+    return _cache["users"]
+
 
+def _find_user(person_id):
+    """Return the stored user dict for person_id, or None. O(1) via the index."""
+    _load_db()
+    return _cache["index"].get(person_id)
 
+
+def _lookup_users(person_ids):
+    """
+    Return the users for person_ids (None if not found), for read-only callers.
+    If another process has committed to SQLite since the last load, the rows are
+    read by primary key instead of reloading every user; the cache is reloaded
+    by the next write or query. Other backends always reload in full.
+    """
+    if STORAGE_BACKEND == "sqlite" and _cache["stamp"] is not None and _file_stamp() != _cache["stamp"]:
+        metrics.record_cache("flat_file_db", False)
+        return [_storage().get(pid) for pid in person_ids]
+    _load_db()
+    index = _cache["index"]
+    return [index.get(pid) for pid in person_ids]
+
+
+@metrics.timed("flat_file_db._save_db")
 def _save_db(users):
-    """Save the list of users to the JSON file."""
-    with open(DB_PATH, "w", encoding="utf-8") as f:
-        json.dump(users, f, indent=2, ensure_ascii=False)
+    """
+    Save the full list of users (an atomic replace for the JSON file).
+    The snapshot then contains everything, so the journal is removed.
+    """
+    try:
+        _storage().replace_all(users)
+        if _uses_journal() and os.path.exists(_journal_path()):
+            os.remove(_journal_path())
+    except BaseException:
+        # The storage may now differ from memory, so force a reload next time.
+        _cache["stamp"] = None
+        raise
+    _set_cache(users, _file_stamp())
 
 
-def create_user(person_id, first_name, last_name, address, street_number, password, enabled=True):
+def _journal_ends_with_newline():
+    """True if the journal is missing, empty or ends with a complete line."""
+    try:
+        with open(_journal_path(), "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+    except FileNotFoundError:
+        return True
+
+
+def _append_journal(users):
+    """Append each changed user record as one JSON line to the journal."""
+    lines = "".join(
+        json.dumps({"op": "put", "user": user}, ensure_ascii=False) + "\n"
+        for user in users
+    )
+    try:
+        # Start on a fresh line if a crash left half a line at the end,
+        # otherwise replay would skip the torn line and this write with it.
+        if not _journal_ends_with_newline():
+            lines = "\n" + lines
+        with open(_journal_path(), "a", encoding="utf-8") as f:
+            f.write(lines)
+    except OSError:
+        _cache["stamp"] = None
+        raise
+    _cache["stamp"] = _file_stamp()
+
+
+@metrics.timed("flat_file_db._persist")
+def _persist(changed, ops=None):
     """
-    Create a new user and add to the database.
-    Raises ValueError if person_id already exists.
+    Persist a list of changed users in one write.
+    In journal mode this is an append. Otherwise the backend decides: the JSON
+    file is rewritten once, the sharded backend rewrites the touched shards and
+    SQLite only upserts the changed rows.
+    ops is the change feed op for each user (default "update").
     """
-    users = _load_db()
+    if not (JOURNAL_MODE and _uses_journal()):
+        try:
+            _storage().save(lambda: _cache["users"], changed)
+            # The JSON snapshot now holds everything; an old journal (from when
+            # JOURNAL_MODE was on) would otherwise be replayed over it on reload.
+            if _uses_journal() and os.path.exists(_journal_path()):
+                os.remove(_journal_path())
+        except BaseException:
+            _cache["stamp"] = None
+            raise
+        _cache["stamp"] = _file_stamp()
+    else:
+        _append_journal(changed)
+        if os.path.getsize(_journal_path()) > JOURNAL_COMPACT_BYTES:
+            compact()
+
+    if CHANGE_FEED:
+        _change_log().append(list(zip(ops or ["update"] * len(changed), changed)))
 
-    for user in users:
-        if user["person_id"] == person_id:
-            raise ValueError(f"User with person_id '{person_id}' already exists.")
 
-    new_user = {
+def compact():
+    """Fold the journal back into users.json and remove the journal."""
+    _save_db(_load_db())
+
+
+def _new_user(person_id, first_name, last_name, address, street_number, password, enabled=True):
+    """Build a user dict with the fixed set of fields."""
+    return {
         "person_id": person_id,
         "first_name": first_name,
         "last_name": last_name,
@@ -48,21 +292,81 @@ def create_user(person_id, first_name, last_name, address, street_number, passwo
         "enabled": enabled,
     }
 
-    users.append(new_user)
-    _save_db(users)
-    return new_user
+
+def _user_from_record(record):
+    """
+    Build a user dict from a record dict (as used by create_users).
+    Raises ValueError on an unknown or missing field.
+    """
+    template = _new_user(None, None, None, None, None, None)
+    for key in record:
+        if key not in template:
+            raise ValueError(f"Unknown field: '{key}'")
+    for key in template:
+        if key not in record and key != "enabled":
+            raise ValueError(f"Missing field: '{key}'")
+    return _new_user(**record)
+
+
+def _add_user(user):
+    """
+    Add a new user dict to the in-memory list and indexes.
+    The secondary indexes go first, so a failure there leaves nothing half-added.
+    """
+    users = _load_db()
+    for index in _cache["secondary"].values():
+        index.add(user)
+    users.append(user)
+    _cache["index"][user["person_id"]] = user
+
+
+def _apply_update(user, fields):
+    """
+    Apply fields to a stored user dict. A new password is hashed.
+    Raises ValueError on an unknown field or a person_id, before anything is changed.
+    """
+    for key in fields:
+        if key not in user:
+            raise ValueError(f"Unknown field: '{key}'")
+    if "person_id" in fields:
+        raise ValueError("person_id cannot be changed.")
+    if "password" in fields:
+        crypto_utils.invalidate_verify_cache(user["password"])
+        fields = dict(fields, password=crypto_utils.hash_password(fields["password"]))
+
+    # Move the user in the secondary indexes of the fields that change
+    changed_indexes = [index for field, index in _cache["secondary"].items() if field in fields]
+    for index in changed_indexes:
+        index.remove(user)
+    user.update(fields)
+    for index in changed_indexes:
+        index.add(user)
+
+
+def create_user(person_id, first_name, last_name, address, street_number, password, enabled=True):
+    """
+    Create a new user and add to the database.
+    Raises ValueError if person_id already exists.
+    """
+    if _find_user(person_id) is not None:
+        raise ValueError(f"User with person_id '{person_id}' already exists.")
+
+    password = crypto_utils.hash_password(password)
+    new_user = _new_user(person_id, first_name, last_name, address, street_number, password, enabled)
+    _add_user(new_user)
+    _persist([new_user], ["create"])
+    return dict(new_user)
 
 
 def read_user(person_id):
     """
     Read a user by person_id.
-    Returns the user dict or None if not found.
+    Returns a copy of the user dict or None if not found.
     """
-    users = _load_db()
-    for user in users:
-        if user["person_id"] == person_id:
-            return user
-    return None
+    user = _lookup_users([person_id])[0]
+    if user is None:
+        return None
+    return dict(user)
 
 
 def update_user(person_id, **fields):
@@ -71,18 +375,14 @@ def update_user(person_id, **fields):
     Only the provided keyword arguments are updated.
     Raises ValueError if the user does not exist.
     """
-    users = _load_db()
-
-    for user in users:
-        if user["person_id"] == person_id:
-            for key, value in fields.items():
-                if key not in user:
-                    raise ValueError(f"Unknown field: '{key}'")
-                user[key] = value
-            _save_db(users)
-            return user
+    user = _find_user(person_id)
+    if user is None:
+        raise ValueError(f"User with person_id '{person_id}' not found.")
 
-    raise ValueError(f"User with person_id '{person_id}' not found.")
+    before = dict(user)
+    _apply_update(user, fields)
+    _persist([user], [changes.classify(before, user)])
+    return dict(user)
 
 
 def enable_user(person_id):
@@ -93,3 +393,186 @@ def enable_user(person_id):
 def disable_user(person_id):
     """Disable a user account (set enabled=False)."""
     return update_user(person_id, enabled=False)
+
+
+# ──────────────────────────────────────────────
+# BATCH API
+# ──────────────────────────────────────────────
+
+def create_users(records):
+    """
+    Create many users and persist them with a single write.
+    records is an iterable of dicts with the same keys as create_user().
+
+    Returns a list with one result per record, in input order:
+    {"person_id": ..., "user": <user dict or None>, "error": <message or None>}.
+    Duplicates (in the database or earlier in the batch) and bad records
+    get an error and are skipped; the rest are created.
+    """
+    _load_db()
+    seen = set(_cache["index"])
+    results = []
+    created = []
+
+    for record in records:
+        person_id = record.get("person_id")
+        if person_id in seen:
+            error = f"User with person_id '{person_id}' already exists."
+            results.append({"person_id": person_id, "user": None, "error": error})
+            continue
+        try:
+            new_user = _user_from_record(record)
+        except ValueError as e:
+            results.append({"person_id": person_id, "user": None, "error": str(e)})
+            continue
+
+        seen.add(person_id)
+        created.append(new_user)
+        results.append({"person_id": person_id, "user": new_user, "error": None})
+
+    # Hash all passwords in parallel in the crypto_utils worker pool
+    hashes = crypto_utils.hash_passwords([user["password"] for user in created])
+    for user, hashed in zip(created, hashes):
+        user["password"] = hashed
+        _add_user(user)
+    for result in results:
+        if result["user"] is not None:
+            result["user"] = dict(result["user"])
+
+    if created:
+        _persist(created, ["create"] * len(created))
+    return results
+
+
+def read_users(person_ids):
+    """
+    Read many users by person_id.
+    Returns a list of user dict copies (or None if not found), in input order.
+    """
+    return [None if user is None else dict(user) for user in _lookup_users(person_ids)]
+
+
+def update_users(updates):
+    """
+    Update many users and persist them with a single write.
+    updates is an iterable of (person_id, fields) pairs, e.g. dict.items().
+
+    Returns a list with one result per update, in input order (same shape as
+    create_users). Unknown users, unknown fields and a person_id in fields get
+    an error and are skipped.
+    New passwords are hashed one at a time; use create_users for bulk onboarding.
+    """
+    _load_db()
+    index = _cache["index"]
+    results = []
+    changed = []
+    ops = []
+
+    for person_id, fields in updates:
+        user = index.get(person_id)
+        if user is None:
+            error = f"User with person_id '{person_id}' not found."
+            results.append({"person_id": person_id, "user": None, "error": error})
+            continue
+        before = dict(user)
+        try:
+            _apply_update(user, fields)
+        except ValueError as e:
+            results.append({"person_id": person_id, "user": None, "error": str(e)})
+            continue
+
+        changed.append(user)
+        ops.append(changes.classify(before, user))
+        results.append({"person_id": person_id, "user": dict(user), "error": None})
+
+    if changed:
+        _persist(changed, ops)
+    return results
+
+
+# ──────────────────────────────────────────────
+# AUTHENTICATION
+# ──────────────────────────────────────────────
+
+def authenticate(person_id, password):
+    """
+    Check a login. Returns a copy of the user if the password matches and the
+    user is enabled, otherwise None.
+    A hash with a lower cost than crypto_utils.BCRYPT_ROUNDS is upgraded on success.
+    Unknown and disabled users cost one bcrypt check too, so timing does not reveal them.
+    """
+    user = _find_user(person_id)
+    if user is None or not user["enabled"] or not crypto_utils.is_password_hash(user["password"]):
+        # Run bcrypt anyway, so a rejected user takes as long as a wrong password
+        crypto_utils.verify_dummy_password(password)
+        return None
+
+    ok, new_hash = crypto_utils.verify_and_update(password, user["password"])
+    if not ok:
+        return None
+    if new_hash is not None:
+        user["password"] = new_hash
+        _persist([user])
+    return dict(user)
+
+
+def migrate_plaintext_passwords(batch_size=100):
+    """
+    Hash every password that is still stored in plaintext.
+    Works in batches: each batch is hashed in the worker pool and persisted
+    before the next one starts. Returns the number of migrated users.
+    """
+    plaintext = [u for u in _load_db() if not crypto_utils.is_password_hash(u["password"])]
+    for start in range(0, len(plaintext), batch_size):
+        batch = plaintext[start:start + batch_size]
+        hashes = crypto_utils.hash_passwords([user["password"] for user in batch])
+        for user, hashed in zip(batch, hashes):
+            user["password"] = hashed
+        _persist(batch)
+    return len(plaintext)
+
+
+# ──────────────────────────────────────────────
+# QUERIES (secondary indexes)
+# ──────────────────────────────────────────────
+
+def find_users(field, value, prefix=False):
+    """
+    Find users by an indexed field (see INDEXED_FIELDS).
+    With prefix=True, PREFIX_FIELDS match on prefix (e.g. last_name "Jen").
+    Returns a list of user dict copies.
+    Raises ValueError if the field has no index, or for a prefix query on a
+    field outside PREFIX_FIELDS or with a non-string prefix.
+    """
+    _load_db()
+    index = _cache["secondary"].get(field)
+    if index is None:
+        raise ValueError(f"No index on field: '{field}'")
+    person_ids = index.find_prefix(value) if prefix else index.find(value)
+    return [dict(_cache["index"][pid]) for pid in person_ids]
+
+
+def find_disabled_users():
+    """Return all disabled users."""
+    return find_users("enabled", False)
+
+
+# ──────────────────────────────────────────────
+# CHANGE FEED
+# ──────────────────────────────────────────────
+
+def iter_changes(since=0, follow=False, timeout=None):
+    """
+    Iterate over the change feed entries with seq > since, oldest first.
+    Each entry is {"seq", "op", "person_id", "user" (without password), "time"}.
+    With follow=True the iterator waits for new changes, until timeout
+    seconds pass without one (None = forever).
+    """
+    if follow:
+        return _change_log().follow(since, timeout=timeout)
+    return iter(_change_log().read(since))
+
+
+def last_change_seq():
+    """The seq of the newest change, or 0 if nothing has changed yet."""
+    return _change_log().last_seq()
@@ -0,0 +1,88 @@
+"""
+Secondary indexes for user records.
+
+A SecondaryIndex maps the values of one field (e.g. last_name) to the
+person_ids that have that value. For prefix fields a sorted list of the
+distinct string values is kept next to it, so prefix queries are a binary
+search instead of a scan. Values of other types (e.g. None) are only kept
+in the value -> person_ids map, so they never have to be compared.
+"""
+
+import bisect
+
+
+class SecondaryIndex:
+    """
+    Index over one field: value -> person_ids (in insertion order).
+    With prefix=True, find_prefix() can be used on the field.
+    """
+
+    def __init__(self, field, prefix=False):
+        self.field = field
+        self.prefix = prefix
+        # value -> {person_id: None}; a dict keeps insertion order, unlike a set
+        self.entries = {}
+        # Distinct str values, sorted, for prefix queries (prefix fields only)
+        self.values = []
+
+    def add(self, user):
+        """Add a user under its current value of the field."""
+        value = user[self.field]
+        ids = self.entries.get(value)
+        if ids is None:
+            ids = self.entries[value] = {}
+            if self.prefix and type(value) is str:
+                bisect.insort(self.values, value)
+        ids[user["person_id"]] = None
+
+    def add_many(self, users):
+        """
+        Add many users at once. The sorted list is built once at the end,
+        instead of one insort per new value (which is O(n²) for n distinct values).
+        """
+        for user in users:
+            self.entries.setdefault(user[self.field], {})[user["person_id"]] = None
+        if self.prefix:
+            self.values = sorted(value for value in self.entries if type(value) is str)
+
+    def remove(self, user):
+        """Remove a user from the index (using its current value of the field)."""
+        value = user[self.field]
+        ids = self.entries.get(value)
+        if ids is None:
+            return
+        ids.pop(user["person_id"], None)
+        if not ids:
+            del self.entries[value]
+            if self.prefix and type(value) is str:
+                self.values.pop(bisect.bisect_left(self.values, value))
+
+    def find(self, value):
+        """person_ids whose field equals value."""
+        return list(self.entries.get(value, ()))
+
+    def find_prefix(self, prefix):
+        """
+        person_ids whose field starts with prefix.
+        Raises ValueError if the index is not a prefix index or prefix is not a str.
+        """
+        if not self.prefix:
+            raise ValueError(f"Field '{self.field}' does not support prefix queries.")
+        if type(prefix) is not str:
+            raise ValueError(f"Prefix for '{self.field}' must be a string.")
+        result = []
+        start = bisect.bisect_left(self.values, prefix)
+        for value in self.values[start:]:
+            if not value.startswith(prefix):
+                break
+            result.extend(self.entries[value])
+        return result
+
+
+def build_indexes(fields, users, prefix_fields=()):
+    """Create a SecondaryIndex per field (prefix index for prefix_fields) and fill it with users."""
+    indexes = {field: SecondaryIndex(field, prefix=field in prefix_fields) for field in fields}
+    users = list(users)
+    for index in indexes.values():
+        index.add_many(users)
+    return indexes
@@ -0,0 +1,116 @@
+"""
+Read-only, memory-mapped access to a user file in the "indexed" format.
+
+Only the offset index (8 bytes per user) is kept in RAM. The records stay
+in the memory-mapped file and are decoded one at a time when accessed, as
+UserRecord objects (with __slots__, no per-record dict).
+
+Create the file with:
+    python src/convert_db.py db/users.json db/users.udx --format indexed
+"""
+
+import mmap
+import sys
+from array import array
+
+import file_format
+from storage import USER_FIELDS
+
+
+class UserRecord:
+    """
+    One decoded user. Uses __slots__ instead of a dict per record.
+    Supports record.first_name as well as record["first_name"].
+    """
+
+    __slots__ = USER_FIELDS
+
+    def __init__(self, values):
+        for field, value in zip(USER_FIELDS, values):
+            setattr(self, field, value)
+
+    def __getitem__(self, field):
+        if field not in USER_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __eq__(self, other):
+        if isinstance(other, UserRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f"UserRecord(person_id={self.person_id!r})"
+
+    def to_dict(self):
+        """Return the record as a plain user dict."""
+        return {field: getattr(self, field) for field in USER_FIELDS}
+
+
+class MappedUsers:
+    """
+    A memory-mapped "indexed" user file.
+    get() does a binary search over the offset index and decodes one record.
+    Use as a context manager, or call close() when done.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, index_offset = file_format.INDEXED_HEADER.unpack_from(self._map, 0)
+        if magic != file_format.INDEXED_MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' is not in the indexed format.")
+
+        self._offsets = array("Q")
+        self._offsets.frombytes(self._map[index_offset:index_offset + 8 * self.count])
+        if sys.byteorder == "big":
+            self._offsets.byteswap()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Unmap and close the file."""
+        self._map.close()
+        self._file.close()
+
+    def __len__(self):
+        return self.count
+
+    def _record_at(self, offset):
+        return UserRecord(file_format.decode_record(self._map, offset))
+
+    def _find_offset(self, person_id):
+        """Binary search the sorted index. Returns the record offset or None."""
+        key = file_format.id_sort_key(person_id)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = file_format.id_sort_key(file_format.decode_record_id(self._map, self._offsets[middle]))
+            if middle_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            offset = self._offsets[low]
+            if file_format.decode_record_id(self._map, offset) == person_id:
+                return offset
+        return None
+
+    def get(self, person_id):
+        """Return the UserRecord for person_id, or None if not found."""
+        offset = self._find_offset(person_id)
+        return None if offset is None else self._record_at(offset)
+
+    def __contains__(self, person_id):
+        return self._find_offset(person_id) is not None
+
+    def __iter__(self):
+        """Decode the records one by one, ordered by person_id."""
+        for offset in self._offsets:
+            yield self._record_at(offset)
@@ -0,0 +1,36 @@
+"""
+Change the number of shards of a sharded user database.
+
+Usage (from the flat-file-db folder):
+    python src/reshard_db.py db/users-shards --shards 8
+    python src/reshard_db.py db/users-shards --shards 4 --source db/users.json
+
+With --source the users are imported from a snapshot file (any format)
+instead of the existing shards.
+"""
+
+import argparse
+
+import storage
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Change the number of shards of a sharded user database.")
+    parser.add_argument("path", help="folder with the shard files")
+    parser.add_argument("--shards", type=int, required=True, help="new number of shards")
+    parser.add_argument("--source", help="import the users from this snapshot file instead")
+    args = parser.parse_args(argv)
+
+    if args.source:
+        users = storage.FileStorage(args.source).load_all()
+        sharded = storage.ShardedStorage(args.path, shards=args.shards)
+        sharded.reshard(args.shards)
+        sharded.replace_all(users)
+        count = len(users)
+    else:
+        count = storage.reshard(args.path, args.shards)
+    print(f"{count} user(s) in {args.shards} shard(s): {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+"""
+Storage backends for user records.
+
+Both flat_file_db.py and the rest-api use this module, so the snapshot
+file (JSON, binary or indexed, see file_format.py), the sharded snapshot
+files and the SQLite database are implemented in one place.
+
+Every backend has the same methods:
+- load_all()                        -> list of user dicts, in insertion order
+- save(snapshot, changed, deleted)  -> persist a change
+- replace_all(users)                -> overwrite everything with users
+- stamp()                           -> changes when another process writes
+
+save() gets both the full list (as a function, snapshot()) and the changed
+and deleted rows. A whole-file backend like JSON writes snapshot(), a
+row-level backend like SQLite only touches the changed rows.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl, the shard locks are skipped there
+    fcntl = None
+
+# metrics.py lives in the crypto-hashing assignment (shared with crypto_utils)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "crypto-hashing", "src"))
+
+import file_format as file_format_module  # noqa: E402
+import metrics  # noqa: E402
+
+# The fixed user fields, in the order they are stored
+USER_FIELDS = ("person_id", "first_name", "last_name", "address", "street_number", "password", "enabled")
+
+
+def stat_stamp(path):
+    """Return (path, mtime_ns, size, inode) for path, or None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (path, st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _fsync_dir(directory):
+    """fsync a directory so a rename inside it survives a crash (no-op where unsupported)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, data):
+    """
+    Atomically replace path with data (str or bytes).
+    The data is written to a temp file in the same folder, fsynced and then
+    moved over the target with os.replace, so readers never see a half-written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".users-", suffix=".tmp", dir=directory)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(directory)
+
+
+# ──────────────────────────────────────────────
+# FILE BACKEND (JSON or binary snapshot)
+# ──────────────────────────────────────────────
+
+class FileStorage:
+    """
+    All users as one snapshot file. Every save rewrites the file atomically.
+    file_format is the format used when writing (one of file_format.FORMATS);
+    reading auto-detects the format, so old files stay readable.
+    """
+
+    def __init__(self, path, indent=2, file_format="json"):
+        if file_format not in file_format_module.FORMATS:
+            raise ValueError(f"Unknown file format: '{file_format}'")
+        self.path = path
+        self.indent = indent
+        self.file_format = file_format
+
+    def stamp(self):
+        """Stat stamp of the file, or None if it does not exist."""
+        return stat_stamp(self.path)
+
+    def load_all(self):
+        """Read the snapshot file. Returns a list of user dicts."""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            data = f.read()
+        metrics.record_bytes("read", len(data))
+        return file_format_module.decode(data)
+
+    def replace_all(self, users):
+        """Write the full list of users to the file."""
+        data = file_format_module.encode(users, self.file_format, self.indent)
+        metrics.record_bytes("write", len(data))
+        atomic_write(self.path, data)
+
+    def save(self, snapshot, changed=(), deleted=()):
+        """A snapshot file can only be rewritten as a whole, so snapshot() is written."""
+        self.replace_all(snapshot())
+
+
+# ──────────────────────────────────────────────
+# SHARDED BACKEND (N snapshot files)
+# ──────────────────────────────────────────────
+
+DEFAULT_SHARDS = 4
+
+_MANIFEST = "shards.json"
+
+
+def shard_of(person_id, shard_count):
+    """
+    Return the shard number for person_id.
+    crc32 instead of hash(), which is randomized per process for strings.
+    """
+    return zlib.crc32(str(person_id).encode("utf-8")) % shard_count
+
+
+@contextmanager
+def file_lock(path, exclusive=True):
+    """Advisory fcntl lock on path (created if missing). A no-op without fcntl."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class ShardedStorage:
+    """
+    Users spread over shard files in the folder path, partitioned by
+    shard_of(person_id). A save only rewrites the shards that contain a
+    changed or deleted user, and each shard has its own lock file, so writers
+    on different shards do not wait for each other.
+
+    The shard count is stored in path/shards.json. The shards argument is only
+    used when the folder is new; use reshard() to change it later.
+    load_all() returns the users shard by shard (insertion order within a shard).
+    """
+
+    def __init__(self, path, shards=DEFAULT_SHARDS, indent=2, file_format="json"):
+        if file_format not in file_format_module.FORMATS:
+            raise ValueError(f"Unknown file format: '{file_format}'")
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self.path = path
+        self.indent = indent
+        self.file_format = file_format
+        self._manifest = (None, None)
+        os.makedirs(path, exist_ok=True)
+        if not os.path.exists(self._manifest_path()):
+            self._write_manifest(shards)
+
+    def _manifest_path(self):
+        return os.path.join(self.path, _MANIFEST)
+
+    def _write_manifest(self, shard_count):
+        atomic_write(self._manifest_path(), json.dumps({"shards": shard_count}))
+
+    def shard_count(self):
+        """The current number of shards (re-read when shards.json changes)."""
+        stamp = stat_stamp(self._manifest_path())
+        if stamp != self._manifest[0]:
+            with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                self._manifest = (stamp, json.load(f)["shards"])
+        return self._manifest[1]
+
+    def shard_path(self, index, shard_count=None):
+        """Path to shard file number index."""
+        shard_count = shard_count or self.shard_count()
+        return os.path.join(self.path, f"shard-{index:03d}-of-{shard_count:03d}")
+
+    def _shard(self, index, shard_count=None):
+        return FileStorage(self.shard_path(index, shard_count), self.indent, self.file_format)
+
+    def stamp(self):
+        """Stat stamps of shards.json and every shard file."""
+        shard_count = self.shard_count()
+        return (self._manifest[0],) + tuple(stat_stamp(self.shard_path(i, shard_count)) for i in range(shard_count))
+
+    def load_all(self):
+        """Read every shard. Returns a list of user dicts."""
+        shard_count = self.shard_count()
+        users = []
+        for index in range(shard_count):
+            users.extend(self._shard(index, shard_count).load_all())
+        return users
+
+    def get(self, person_id):
+        """Read only the shard that person_id belongs to. Returns a dict or None."""
+        shard_count = self.shard_count()
+        for user in self._shard(shard_of(person_id, shard_count), shard_count).load_all():
+            if user["person_id"] == person_id:
+                return user
+        return None
+
+    def _write_shards(self, users, shard_count):
+        """Write users to shard_count new shard files."""
+        parts = [[] for _ in range(shard_count)]
+        for user in users:
+            parts[shard_of(user["person_id"], shard_count)].append(user)
+        for index, part in enumerate(parts):
+            self._shard(index, shard_count).replace_all(part)
+
+    def replace_all(self, users):
+        """Rewrite every shard with users."""
+        with file_lock(self._manifest_path() + ".lock"):
+            self._write_shards(users, self.shard_count())
+
+    def save(self, snapshot, changed=(), deleted=()):
+        """
+        Rewrite only the shards touched by changed and deleted; snapshot is not used.
+        Each touched shard is re-read and updated under its own lock.
+        """
+        # Shared lock: many savers at once, but not while reshard() runs
+        with file_lock(self._manifest_path() + ".lock", exclusive=False):
+            shard_count = self.shard_count()
+            touched = {}
+            for user in changed:
+                touched.setdefault(shard_of(user["person_id"], shard_count), ([], []))[0].append(user)
+            for person_id in deleted:
+                touched.setdefault(shard_of(person_id, shard_count), ([], []))[1].append(person_id)
+
+            for index in sorted(touched):
+                shard_changed, shard_deleted = touched[index]
+                shard = self._shard(index, shard_count)
+                with file_lock(shard.path + ".lock"):
+                    shard.replace_all(_apply_changes(shard.load_all(), shard_changed, shard_deleted))
+
+    def reshard(self, shard_count):
+        """
+        Move all users to shard_count shards. The new shard files are written
+        first and shards.json is switched after, so a crash leaves the old
+        layout intact. Returns the number of users moved.
+        """
+        if shard_count < 1:
+            raise ValueError("shards must be at least 1")
+        with file_lock(self._manifest_path() + ".lock"):
+            old_count = self.shard_count()
+            users = self.load_all()
+            if shard_count != old_count:
+                self._write_shards(users, shard_count)
+                self._write_manifest(shard_count)
+                for index in range(old_count):
+                    for suffix in ("", ".lock"):
+                        path = self.shard_path(index, old_count) + suffix
+                        if os.path.exists(path):
+                            os.remove(path)
+        return len(users)
+
+
+def _apply_changes(users, changed, deleted):
+    """Return users with changed upserted (by person_id) and deleted removed."""
+    deleted = set(deleted)
+    position = {user["person_id"]: i for i, user in enumerate(users)}
+    users = list(users)
+    for user in changed:
+        if user["person_id"] in position:
+            users[position[user["person_id"]]] = user
+        else:
+            position[user["person_id"]] = len(users)
+            users.append(user)
+    return [user for user in users if user["person_id"] not in deleted]
+
+
+# ──────────────────────────────────────────────
+# SQLITE BACKEND
+# ──────────────────────────────────────────────
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS users (
+    person_id PRIMARY KEY,
+    first_name TEXT,
+    last_name TEXT,
+    address TEXT,
+    street_number TEXT,
+    password TEXT,
+    enabled INTEGER
+)
+"""
+
+# Constant SQL strings with ? parameters, so sqlite3 reuses the prepared statements
+_SELECT_ALL = "SELECT " + ", ".join(USER_FIELDS) + " FROM users ORDER BY rowid"
+_SELECT_ONE = "SELECT " + ", ".join(USER_FIELDS) + " FROM users WHERE person_id = ?"
+_UPSERT = (
+    "INSERT INTO users (" + ", ".join(USER_FIELDS) + ") VALUES (" + ", ".join("?" * len(USER_FIELDS)) + ") "
+    "ON CONFLICT(person_id) DO UPDATE SET "
+    + ", ".join(f"{field} = excluded.{field}" for field in USER_FIELDS[1:])
+)
+_DELETE = "DELETE FROM users WHERE person_id = ?"
+
+
+def _row_to_user(row):
+    """Convert a SELECT row to a user dict."""
+    user = dict(zip(USER_FIELDS, row))
+    user["enabled"] = bool(user["enabled"])
+    return user
+
+
+def _user_to_row(user):
+    """Convert a user dict to the parameter tuple for _UPSERT."""
+    return tuple(user[field] for field in USER_FIELDS)
+
+
+class SqliteStorage:
+    """
+    Users in an embedded SQLite database (WAL mode, person_id as primary key).
+    Saves only touch the changed rows, so a write does not scale with table size.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # One connection shared by all threads, guarded by a lock. That keeps
+        # PRAGMA data_version meaningful: it only changes on commits by other
+        # connections, i.e. other processes.
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(_CREATE_TABLE)
+
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+
+    def stamp(self):
+        """PRAGMA data_version, which changes when another connection commits."""
+        with self.lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def load_all(self):
+        """Return all users in insertion order."""
+        with self.lock:
+            return [_row_to_user(row) for row in self.conn.execute(_SELECT_ALL)]
+
+    def get(self, person_id):
+        """Point lookup by person_id via the primary key index. Returns a dict or None."""
+        with self.lock:
+            row = self.conn.execute(_SELECT_ONE, (person_id,)).fetchone()
+        return None if row is None else _row_to_user(row)
+
+    def _write(self, changed, deleted, clear=False):
+        """Apply upserts and deletes in one transaction."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if clear:
+                    self.conn.execute("DELETE FROM users")
+                self.conn.executemany(_DELETE, ((person_id,) for person_id in deleted))
+                self.conn.executemany(_UPSERT, (_user_to_row(user) for user in changed))
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    def replace_all(self, users):
+        """Delete every row and insert users."""
+        self._write(users, (), clear=True)
+
+    def save(self, snapshot, changed=(), deleted=()):
+        """Upsert the changed users and delete the deleted person_ids; snapshot is not used."""
+        self._write(changed, deleted)
+
+
+# ──────────────────────────────────────────────
+# CONFIG
+# ──────────────────────────────────────────────
+
+BACKENDS = {
+    "json": FileStorage,
+    "sharded": ShardedStorage,
+    "sqlite": SqliteStorage,
+}
+
+
+def open_storage(backend, path, **options):
+    """
+    Create a storage backend by name ("json", "sharded" or "sqlite").
+    Extra options are passed on, e.g. indent and file_format for the file
+    backends and shards for the sharded one.
+    Raises ValueError on an unknown backend name.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: '{backend}'")
+    return BACKENDS[backend](path, **options)
+
+
+def convert_file(source_path, target_path, target_format, indent=2):
+    """
+    Convert a snapshot file to another format (one of file_format.FORMATS).
+    The source format is detected automatically.
+    Returns the number of users converted.
+    """
+    users = FileStorage(source_path).load_all()
+    FileStorage(target_path, indent=indent, file_format=target_format).replace_all(users)
+    return len(users)
+
+
+def reshard(path, shard_count):
+    """Change the number of shards of the sharded folder at path. Returns the number of users."""
+    return ShardedStorage(path).reshard(shard_count)
@@ -7,23 +7,41 @@ Uses Given / When / Then comments to describe each test scenario.
 import json
 import os
 import sys
+import threading
 import pytest
 
 # Add the src folder to the path so we can import flat_file_db
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
 
 import flat_file_db
+import indexes
+import storage
 
 # Path to the test database
 TEST_DB_PATH = os.path.join(os.path.dirname(__file__), "..", "db", "users.json")
 
 
+# Path to the journal that belongs to the test database
+TEST_JOURNAL_PATH = TEST_DB_PATH + ".log"
+
+
+@pytest.fixture(autouse=True)
+def fast_hashing(monkeypatch):
+    """Use the lowest bcrypt cost so the tests run fast."""
+    monkeypatch.setattr(flat_file_db.crypto_utils, "BCRYPT_ROUNDS", 4)
+
+
 @pytest.fixture(autouse=True)
-def clean_db():
-    """Reset the database before and after each test."""
+def clean_db(monkeypatch, tmp_path):
+    """Reset the database (and its journal) before and after each test. The change feed goes to a temp folder."""
+    monkeypatch.setattr(flat_file_db, "CHANGES_PATH", str(tmp_path / "users.changes.log"))
+    if os.path.exists(TEST_JOURNAL_PATH):
+        os.remove(TEST_JOURNAL_PATH)
     with open(TEST_DB_PATH, "w", encoding="utf-8") as f:
         json.dump([], f)
     yield
+    if os.path.exists(TEST_JOURNAL_PATH):
+        os.remove(TEST_JOURNAL_PATH)
     with open(TEST_DB_PATH, "w", encoding="utf-8") as f:
         json.dump([], f)
 
@@ -194,7 +212,566 @@ def test_enable_user():
 
 
 # ──────────────────────────────────────────────
-# TEST: Intentionally FAILING test
+# TEST: Reads are served from memory
+# ──────────────────────────────────────────────
+def test_read_user_does_not_reparse_file(monkeypatch):
+    """
+    GIVEN: A user exists and the database has been loaded once
+    WHEN:  The user is read several times
+    THEN:  The JSON file is not parsed again
+    """
+    # Given
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+    flat_file_db.read_user("1")
+
+    calls = []
+    original = flat_file_db._read_file
+    monkeypatch.setattr(flat_file_db, "_read_file", lambda: calls.append(1) or original())
+
+    # When
+    for _ in range(10):
+        flat_file_db.read_user("1")
+
+    # Then
+    assert calls == []
+
+
+# ──────────────────────────────────────────────
+# TEST: External changes to the file are picked up
+# ──────────────────────────────────────────────
+def test_external_file_change_is_reloaded():
+    """
+    GIVEN: The database has been loaded into memory
+    WHEN:  Another process writes a new user directly to the JSON file
+    THEN:  The new user can be read
+    """
+    # Given
+    assert flat_file_db.read_user("2") is None
+
+    # When
+    with open(TEST_DB_PATH, "w", encoding="utf-8") as f:
+        json.dump([{
+            "person_id": "2",
+            "first_name": "Bo",
+            "last_name": "Hansen",
+            "address": "Skovvej",
+            "street_number": "5",
+            "password": "password456",
+            "enabled": True,
+        }], f)
+
+    # Then
+    user = flat_file_db.read_user("2")
+    assert user is not None
+    assert user["first_name"] == "Bo"
+
+
+# ──────────────────────────────────────────────
+# TEST: Journal mode appends instead of rewriting
+# ──────────────────────────────────────────────
+def test_journal_mode_appends_and_replays(monkeypatch):
+    """
+    GIVEN: Journal mode is enabled
+    WHEN:  A user is created and updated
+    THEN:  users.json is untouched, the journal has one line per write,
+           and a fresh load (snapshot + journal) sees the latest data
+    """
+    # Given
+    monkeypatch.setattr(flat_file_db, "JOURNAL_MODE", True)
+
+    # When
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+    flat_file_db.update_user("1", address="Skovvej")
+
+    # Then
+    with open(TEST_DB_PATH, "r", encoding="utf-8") as f:
+        assert json.load(f) == []
+    with open(TEST_JOURNAL_PATH, "r", encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+    users = flat_file_db._read_file()
+    assert len(users) == 1
+    assert users[0]["address"] == "Skovvej"
+
+
+def test_journal_append_after_torn_line_is_kept(monkeypatch):
+    """
+    GIVEN: Journal mode is enabled and a crash left half a line at the end of the journal
+    WHEN:  A new user is created
+    THEN:  The new write starts on its own line, and a fresh load sees it
+    """
+    # Given
+    monkeypatch.setattr(flat_file_db, "JOURNAL_MODE", True)
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+    with open(TEST_JOURNAL_PATH, "a", encoding="utf-8") as f:
+        f.write('{"op": "put", "user": {"person_id": "2", "first')
+
+    # When
+    flat_file_db.create_user("3", "Carl", "Hansen", "Strandvej", "1", "password789")
+
+    # Then
+    users = flat_file_db._read_file()
+    assert [u["person_id"] for u in users] == ["1", "3"]
+
+
+def test_snapshot_write_removes_old_journal(monkeypatch):
+    """
+    GIVEN: A user was created in journal mode, and journal mode is then turned off
+    WHEN:  The user is updated (a full snapshot write) and the database is reloaded
+    THEN:  The journal is gone and the update is not overwritten by the old journal
+    """
+    # Given
+    monkeypatch.setattr(flat_file_db, "JOURNAL_MODE", True)
+    flat_file_db.create_user("1", "Anders", "Jensen", "Old street", "12", "hemmeligt123")
+    monkeypatch.setattr(flat_file_db, "JOURNAL_MODE", False)
+
+    # When
+    flat_file_db.update_user("1", address="New street")
+    flat_file_db._cache["stamp"] = None
+
+    # Then
+    assert not os.path.exists(TEST_JOURNAL_PATH)
+    assert flat_file_db.read_user("1")["address"] == "New street"
+
+
+# ──────────────────────────────────────────────
+# TEST: Compaction folds the journal into the snapshot
+# ──────────────────────────────────────────────
+def test_journal_is_compacted_past_threshold(monkeypatch):
+    """
+    GIVEN: Journal mode is enabled with a tiny compaction threshold
+    WHEN:  Enough writes are made to pass the threshold
+    THEN:  The journal is removed and users.json holds all users
+    """
+    # Given
+    monkeypatch.setattr(flat_file_db, "JOURNAL_MODE", True)
+    monkeypatch.setattr(flat_file_db, "JOURNAL_COMPACT_BYTES", 1)
+
+    # When
+    for i in range(3):
+        flat_file_db.create_user(str(i), "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+
+    # Then
+    assert not os.path.exists(TEST_JOURNAL_PATH)
+    with open(TEST_DB_PATH, "r", encoding="utf-8") as f:
+        assert [u["person_id"] for u in json.load(f)] == ["0", "1", "2"]
+
+
+# ──────────────────────────────────────────────
+# TEST: A failed save leaves the old snapshot intact
+# ──────────────────────────────────────────────
+def test_failed_save_keeps_old_snapshot(monkeypatch):
+    """
+    GIVEN: A user exists in the database
+    WHEN:  Saving a second user fails right before the file is replaced
+    THEN:  users.json still holds the complete old snapshot and no temp file is left
+    """
+    # Given
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+
+    def broken_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(flat_file_db.os, "replace", broken_replace)
+
+    # When
+    with pytest.raises(OSError):
+        flat_file_db.create_user("2", "Bo", "Hansen", "Skovvej", "5", "password456")
+
+    # Then
+    with open(TEST_DB_PATH, "r", encoding="utf-8") as f:
+        assert [u["person_id"] for u in json.load(f)] == ["1"]
+    db_dir = os.path.dirname(TEST_DB_PATH)
+    assert not [name for name in os.listdir(db_dir) if name.endswith(".tmp")]
+
+
+# ──────────────────────────────────────────────
+# TEST: Batch create
+# ──────────────────────────────────────────────
+def test_create_users_batch_reports_per_item_errors(monkeypatch):
+    """
+    GIVEN: A user with person_id '1' already exists
+    WHEN:  A batch is created with a new user, a duplicate, a repeat within
+           the batch and a record with an unknown field
+    THEN:  Only the new user is created, the others get an error,
+           and the database is written only once
+    """
+    # Given
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+    saves = []
+    original = flat_file_db.storage.atomic_write
+    monkeypatch.setattr(flat_file_db.storage, "atomic_write", lambda path, text: saves.append(1) or original(path, text))
+
+    base = {"first_name": "Bo", "last_name": "Hansen", "address": "Skovvej",
+            "street_number": "5", "password": "password456"}
+
+    # When
+    results = flat_file_db.create_users([
+        dict(base, person_id="2"),
+        dict(base, person_id="1"),
+        dict(base, person_id="2"),
+        dict(base, person_id="3", email="bo@example.com"),
+    ])
+
+    # Then
+    assert [r["error"] is None for r in results] == [True, False, False, False]
+    assert "Unknown field" in results[3]["error"]
+    assert saves == [1]
+    assert flat_file_db.read_user("2")["first_name"] == "Bo"
+    assert flat_file_db.read_user("3") is None
+
+
+# ──────────────────────────────────────────────
+# TEST: Batch read and update
+# ──────────────────────────────────────────────
+def test_read_and_update_users_batch():
+    """
+    GIVEN: Two users exist
+    WHEN:  They are updated in one batch (plus an unknown user) and read back in one batch
+    THEN:  Both updates are applied and the unknown user gets an error / None
+    """
+    # Given
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+    flat_file_db.create_user("2", "Bo", "Hansen", "Skovvej", "5", "password456")
+
+    # When
+    results = flat_file_db.update_users({
+        "1": {"enabled": False},
+        "2": {"address": "Strandvej"},
+        "9": {"enabled": False},
+    }.items())
+    users = flat_file_db.read_users(["1", "2", "9"])
+
+    # Then
+    assert [r["error"] is None for r in results] == [True, True, False]
+    assert users[0]["enabled"] is False
+    assert users[1]["address"] == "Strandvej"
+    assert users[2] is None
+
+
+def test_update_users_rejects_person_id_change():
+    """
+    GIVEN: Users 1 and 2 exist
+    WHEN:  A batch tries to change user 1's person_id to 2, next to a valid update
+    THEN:  That item gets an error, the valid update is applied and both users are intact after a reload
+    """
+    # Given
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+    flat_file_db.create_user("2", "Bo", "Hansen", "Skovvej", "5", "password456")
+
+    # When
+    results = flat_file_db.update_users([("1", {"person_id": "2"}), ("2", {"address": "Strandvej"})])
+    flat_file_db._cache["stamp"] = None
+
+    # Then
+    assert "person_id" in results[0]["error"]
+    assert results[1]["error"] is None
+    assert flat_file_db.read_user("1")["person_id"] == "1"
+    assert flat_file_db.read_user("2")["address"] == "Strandvej"
+    with open(TEST_DB_PATH, "r", encoding="utf-8") as f:
+        assert [u["person_id"] for u in json.load(f)] == ["1", "2"]
+
+
+# ──────────────────────────────────────────────
+# TEST: Authenticate with the hashed password
+# ──────────────────────────────────────────────
+def test_authenticate():
+    """
+    GIVEN: An enabled user and a disabled user exist
+    WHEN:  We authenticate with right and wrong passwords
+    THEN:  Only the right password for the enabled user returns the user
+    """
+    # Given
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+    flat_file_db.create_user("2", "Bo", "Hansen", "Skovvej", "5", "password456", enabled=False)
+
+    # When / Then
+    assert flat_file_db.authenticate("1", "hemmeligt123")["person_id"] == "1"
+    assert flat_file_db.authenticate("1", "forkert") is None
+    assert flat_file_db.authenticate("2", "password456") is None
+    assert flat_file_db.authenticate("9", "hemmeligt123") is None
+
+
+def test_authenticate_runs_bcrypt_for_rejected_users(monkeypatch):
+    """
+    GIVEN: A disabled user exists
+    WHEN:  We authenticate as the disabled user and as an unknown user
+    THEN:  Both are rejected, but bcrypt runs each time, so timing does not reveal the user
+    """
+    # Given
+    flat_file_db.create_user("2", "Bo", "Hansen", "Skovvej", "5", "password456", enabled=False)
+    checked = []
+    verify = flat_file_db.crypto_utils.verify_password
+    monkeypatch.setattr(flat_file_db.crypto_utils, "verify_password", lambda p, h: checked.append(h) or verify(p, h))
+
+    # When
+    disabled = flat_file_db.authenticate("2", "password456")
+    unknown = flat_file_db.authenticate("9", "hemmeligt123")
+
+    # Then
+    assert disabled is None and unknown is None
+    assert len(checked) == 2
+    assert all(flat_file_db.crypto_utils.get_hash_rounds(h) == 4 for h in checked)
+
+
+# ──────────────────────────────────────────────
+# TEST: Migrate plaintext passwords
+# ──────────────────────────────────────────────
+def test_migrate_plaintext_passwords():
+    """
+    GIVEN: users.json holds three users with plaintext passwords
+    WHEN:  The passwords are migrated in batches of two
+    THEN:  All passwords are hashed and the users can authenticate
+    """
+    # Given
+    users = [
+        {"person_id": str(i), "first_name": "Anders", "last_name": "Jensen", "address": "Parkvej",
+         "street_number": "12", "password": f"hemmeligt{i}", "enabled": True}
+        for i in range(3)
+    ]
+    with open(TEST_DB_PATH, "w", encoding="utf-8") as f:
+        json.dump(users, f)
+
+    # When
+    migrated = flat_file_db.migrate_plaintext_passwords(batch_size=2)
+
+    # Then
+    assert migrated == 3
+    with open(TEST_DB_PATH, "r", encoding="utf-8") as f:
+        assert all(u["password"].startswith("$2") for u in json.load(f))
+    assert flat_file_db.authenticate("2", "hemmeligt2") is not None
+
+
+# ──────────────────────────────────────────────
+# TEST: The SQLite backend
+# ──────────────────────────────────────────────
+def test_sqlite_backend(monkeypatch, tmp_path):
+    """
+    GIVEN: The SQLite storage backend is selected
+    WHEN:  A user is created, disabled and the in-memory cache is dropped
+    THEN:  The user is read back from SQLite with the change, and users.json is untouched
+    """
+    # Given
+    monkeypatch.setattr(flat_file_db, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(flat_file_db, "SQLITE_PATH", str(tmp_path / "users.db"))
+
+    # When
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+    flat_file_db.disable_user("1")
+    flat_file_db._cache["stamp"] = None
+
+    # Then
+    user = flat_file_db.read_user("1")
+    assert user["enabled"] is False
+    assert flat_file_db.authenticate("1", "hemmeligt123") is None
+    with open(TEST_DB_PATH, "r", encoding="utf-8") as f:
+        assert json.load(f) == []
+
+
+def test_sqlite_point_read_after_external_commit(monkeypatch, tmp_path):
+    """
+    GIVEN: The SQLite backend with one user loaded into memory
+    WHEN:  Another connection (e.g. another process) commits a second user
+    THEN:  read_user and read_users find it by primary key without reloading every user
+    """
+    # Given
+    monkeypatch.setattr(flat_file_db, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(flat_file_db, "SQLITE_PATH", str(tmp_path / "users.db"))
+    flat_file_db._cache["stamp"] = None
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+    flat_file_db.read_user("1")
+
+    # When
+    other = storage.SqliteStorage(str(tmp_path / "users.db"))
+    other.save(None, changed=[dict(flat_file_db.read_user("1"), person_id="2", first_name="Bo")])
+    other.close()
+    monkeypatch.setattr(storage.SqliteStorage, "load_all", lambda self: pytest.fail("full reload"))
+
+    # Then
+    assert flat_file_db.read_user("2")["first_name"] == "Bo"
+    assert [u and u["person_id"] for u in flat_file_db.read_users(["1", "2", "9"])] == ["1", "2", None]
+
+
+# ──────────────────────────────────────────────
+# TEST: The sharded backend
+# ──────────────────────────────────────────────
+def test_sharded_backend(monkeypatch, tmp_path):
+    """
+    GIVEN: The sharded storage backend with 3 shards is selected
+    WHEN:  Ten users are created, one is disabled and the in-memory cache is dropped
+    THEN:  All users are read back from the shards with the change
+    """
+    # Given
+    monkeypatch.setattr(flat_file_db, "STORAGE_BACKEND", "sharded")
+    monkeypatch.setattr(flat_file_db, "SHARD_PATH", str(tmp_path / "shards"))
+    monkeypatch.setattr(flat_file_db, "SHARD_COUNT", 3)
+
+    # When
+    flat_file_db.create_users([
+        {"person_id": str(i), "first_name": "Anders", "last_name": "Jensen",
+         "address": "Parkvej", "street_number": "12", "password": "hemmeligt123"}
+        for i in range(10)
+    ])
+    flat_file_db.disable_user("4")
+    flat_file_db._cache["stamp"] = None
+
+    # Then
+    assert len(flat_file_db._load_db()) == 10
+    assert flat_file_db.read_user("4")["enabled"] is False
+    assert len(os.listdir(tmp_path / "shards")) >= 4
+
+
+# ──────────────────────────────────────────────
+# TEST: Change feed
+# ──────────────────────────────────────────────
+def test_change_feed_records_mutations_in_order(monkeypatch):
+    """
+    GIVEN: An empty database with the change feed enabled, scanned in small blocks
+    WHEN:  A user is created, disabled, enabled and renamed
+    THEN:  The change feed has four entries with increasing seq, the right ops
+           and no password, and iter_changes(since) only returns the newer ones
+    """
+    # Given
+    monkeypatch.setattr(flat_file_db, "CHANGE_FEED", True)
+    monkeypatch.setattr(flat_file_db.changes, "READ_BLOCK_SIZE", 64)
+    start = flat_file_db.last_change_seq()
+
+    # When
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+    flat_file_db.disable_user("1")
+    flat_file_db.enable_user("1")
+    flat_file_db.update_user("1", last_name="Hansen")
+
+    # Then
+    feed = list(flat_file_db.iter_changes(since=start))
+    assert [entry["op"] for entry in feed] == ["create", "disable", "enable", "update"]
+    assert [entry["seq"] for entry in feed] == list(range(start + 1, start + 5))
+    assert all("password" not in entry["user"] for entry in feed)
+    assert feed[-1]["user"]["last_name"] == "Hansen"
+    assert [e["op"] for e in flat_file_db.iter_changes(since=feed[1]["seq"])] == ["enable", "update"]
+    assert flat_file_db.last_change_seq() == start + 4
+
+
+def test_change_feed_is_off_by_default():
+    """
+    GIVEN: The default settings
+    WHEN:  A user is created
+    THEN:  No change log is written
+    """
+    # Given / When
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+
+    # Then
+    assert not os.path.exists(flat_file_db.CHANGES_PATH)
+
+
+def test_change_feed_follow_waits_for_new_changes(monkeypatch):
+    """
+    GIVEN: The change feed is enabled and a follower iterates it from the current position
+    WHEN:  Another thread creates a user shortly after
+    THEN:  The follower receives the create entry
+    """
+    # Given
+    monkeypatch.setattr(flat_file_db, "CHANGE_FEED", True)
+    since = flat_file_db.last_change_seq()
+    follower = flat_file_db.iter_changes(since=since, follow=True, timeout=5)
+
+    # When
+    timer = threading.Timer(
+        0.2, flat_file_db.create_user, args=("2", "Bo", "Hansen", "Skovvej", "3", "hemmeligt123")
+    )
+    timer.start()
+    entry = next(follower)
+    timer.join()
+
+    # Then
+    assert entry["op"] == "create"
+    assert entry["person_id"] == "2"
+
+
+# ──────────────────────────────────────────────
+# TEST: Secondary indexes
+# ──────────────────────────────────────────────
+def test_find_users_by_indexed_fields():
+    """
+    GIVEN: Three users with different last names
+    WHEN:  One user is disabled and another changes last name
+    THEN:  Exact and prefix queries reflect the changes without a reload
+    """
+    # Given
+    flat_file_db.create_user("1", "Anders", "Jensen", "Parkvej", "12", "hemmeligt123")
+    flat_file_db.create_user("2", "Bo", "Jeppesen", "Skovvej", "5", "password456")
+    flat_file_db.create_user("3", "Carl", "Hansen", "Strandvej", "1", "password789")
+
+    # When
+    flat_file_db.disable_user("2")
+    flat_file_db.update_user("3", last_name="Jensen")
+
+    # Then
+    assert [u["person_id"] for u in flat_file_db.find_disabled_users()] == ["2"]
+    assert [u["person_id"] for u in flat_file_db.find_users("last_name", "Jensen")] == ["1", "3"]
+    assert [u["person_id"] for u in flat_file_db.find_users("last_name", "Je", prefix=True)] == ["1", "3", "2"]
+    assert flat_file_db.find_users("last_name", "Hansen") == []
+    with pytest.raises(ValueError):
+        flat_file_db.find_users("address", "Parkvej")
+
+
+def test_indexes_accept_non_string_values():
+    """
+    GIVEN: A users.json where one user has a null last_name
+    WHEN:  Another user is created with a None last_name
+    THEN:  Both load and are found, and a prefix query on 'enabled' raises ValueError
+    """
+    # Given
+    with open(TEST_DB_PATH, "w", encoding="utf-8") as f:
+        json.dump([{
+            "person_id": "1",
+            "first_name": "Anders",
+            "last_name": None,
+            "address": "Parkvej",
+            "street_number": "12",
+            "password": "hemmeligt123",
+            "enabled": True,
+        }], f)
+    flat_file_db.create_user("2", "Bo", "Jensen", "Skovvej", "5", "password456")
+
+    # When
+    flat_file_db.create_user("3", "Carl", None, "Strandvej", "1", "password789")
+
+    # Then
+    assert [u["person_id"] for u in flat_file_db.find_users("last_name", None)] == ["1", "3"]
+    assert [u["person_id"] for u in flat_file_db.find_users("last_name", "J", prefix=True)] == ["2"]
+    with pytest.raises(ValueError):
+        flat_file_db.find_users("enabled", True, prefix=True)
+    with pytest.raises(ValueError):
+        flat_file_db.find_users("last_name", None, prefix=True)
+
+
+def test_bulk_built_index_matches_incremental_adds():
+    """
+    GIVEN: Users with repeated, distinct and None last names
+    WHEN:  An index is built in bulk with build_indexes and another with one add() per user
+    THEN:  Both hold the same sorted values and answer prefix queries the same way
+    """
+    # Given
+    users = [
+        {"person_id": str(i), "last_name": name}
+        for i, name in enumerate(["Jensen", None, "Hansen", "Jensen", "Jeppesen", None])
+    ]
+
+    # When
+    bulk = indexes.build_indexes(["last_name"], users, ["last_name"])["last_name"]
+    incremental = indexes.SecondaryIndex("last_name", prefix=True)
+    for user in users:
+        incremental.add(user)
+
+    # Then
+    assert bulk.values == incremental.values == ["Hansen", "Jensen", "Jeppesen"]
+    assert bulk.find_prefix("Je") == incremental.find_prefix("Je") == ["0", "3", "4"]
+    assert bulk.find(None) == ["1", "5"]
+
+
+# ──────────────────────────────────────────────
+# TEST: Passwords are hashed (formerly an intentionally failing test)
 # ──────────────────────────────────────────────
 def test_password_is_hashed__expected_fail():
     """
@@ -203,11 +780,9 @@ def test_password_is_hashed__expected_fail():
     THEN:  The stored password should NOT equal the plaintext password
            (i.e., it should be hashed)
 
-    NOTE: This test INTENTIONALLY FAILS because the current implementation
-    stores passwords in plaintext. This is a known security issue.
-
-    TO MAKE IT PASS: Integrate password hashing (e.g. bcrypt) in create_user()
-    so that the stored password differs from the plaintext input.
+    NOTE: This test was written to FAIL while passwords were stored in
+    plaintext. It PASSES NOW, since create_user() hashes the password with
+    bcrypt. The name is kept so it still matches the README.
     """
     # Given
     plaintext_password = "hemmeligt123"
@@ -223,7 +798,7 @@ def test_password_is_hashed__expected_fail():
     # When
     user = flat_file_db.read_user("1")
 
-    # Then — this WILL FAIL because the password is stored as plaintext
+    # Then — passes now, because create_user() stores a bcrypt hash
     assert user["password"] != plaintext_password, (
         "Password is stored in plaintext! It should be hashed."
     )
@@ -0,0 +1,263 @@
+"""
+Tests for the storage backends (storage.py).
+
+The same scenarios run against the JSON file and the SQLite backend.
+Uses Given / When / Then comments to describe each test scenario.
+"""
+
+import os
+import sys
+import pytest
+
+# Add the src folder to the path so we can import storage
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import mapped_store
+import storage
+
+
+def make_user(person_id, address="Parkvej"):
+    return {
+        "person_id": person_id,
+        "first_name": "Anders",
+        "last_name": "Jensen",
+        "address": address,
+        "street_number": "12",
+        "password": "hash",
+        "enabled": True,
+    }
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, tmp_path):
+    """An empty storage backend of each kind in a temp folder."""
+    path = str(tmp_path / f"users.{request.param}")
+    return storage.open_storage(request.param, path)
+
+
+# ──────────────────────────────────────────────
+# TEST: Save and load
+# ──────────────────────────────────────────────
+def test_save_changed_and_deleted_rows(backend):
+    """
+    GIVEN: A backend holding two users
+    WHEN:  One user is changed, one is deleted and one is added in a single save
+    THEN:  load_all returns the result in insertion order
+    """
+    # Given
+    users = [make_user("1"), make_user("2")]
+    backend.replace_all(users)
+
+    # When
+    users = [make_user("1", address="Skovvej"), make_user("3")]
+    backend.save(lambda: users, changed=users, deleted=["2"])
+
+    # Then
+    loaded = backend.load_all()
+    assert [u["person_id"] for u in loaded] == ["1", "3"]
+    assert loaded[0]["address"] == "Skovvej"
+    assert loaded[0]["enabled"] is True
+
+
+# ──────────────────────────────────────────────
+# TEST: Stamp changes on writes from elsewhere
+# ──────────────────────────────────────────────
+def test_stamp_changes_when_another_writer_saves(backend, tmp_path):
+    """
+    GIVEN: A backend and a second backend on the same file (another process)
+    WHEN:  The second backend writes
+    THEN:  The first backend's stamp changes
+    """
+    # Given
+    backend.replace_all([make_user("1")])
+    other = storage.open_storage("sqlite" if isinstance(backend, storage.SqliteStorage) else "json", backend.path)
+    before = backend.stamp()
+
+    # When
+    other.save(lambda: [make_user("1"), make_user("2")], changed=[make_user("2")])
+
+    # Then
+    assert backend.stamp() != before
+    assert len(backend.load_all()) == 2
+
+
+# ──────────────────────────────────────────────
+# TEST: Unknown backend name
+# ──────────────────────────────────────────────
+def test_unknown_backend_raises_error(tmp_path):
+    """
+    GIVEN: A backend name that does not exist
+    WHEN:  We try to open it
+    THEN:  A ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        storage.open_storage("mongodb", str(tmp_path / "users"))
+
+
+
+# ──────────────────────────────────────────────
+# TEST: Snapshot formats round-trip and are auto-detected
+# ──────────────────────────────────────────────
+@pytest.mark.parametrize("file_format", ["json", "json-min", "binary", "indexed"])
+@pytest.mark.parametrize("person_ids", [["1", "2"], [1, 2]])
+def test_file_formats_round_trip(tmp_path, file_format, person_ids):
+    """
+    GIVEN: Users with string or int ids and non-ASCII text
+    WHEN:  They are written in a format and read by a storage that was not told the format
+    THEN:  The same users come back
+    """
+    # Given
+    users = [make_user(pid, address="Ærøvej") for pid in person_ids]
+    users[1]["enabled"] = False
+    path = str(tmp_path / "users.db")
+
+    # When
+    storage.FileStorage(path, file_format=file_format).replace_all(users)
+
+    # Then
+    assert storage.FileStorage(path).load_all() == users
+
+
+# ──────────────────────────────────────────────
+# TEST: Convert between formats
+# ──────────────────────────────────────────────
+def test_convert_file_to_binary_and_back(tmp_path):
+    """
+    GIVEN: A pretty-printed JSON file with 100 users
+    WHEN:  It is converted to binary and back to JSON
+    THEN:  The binary file is smaller and the final JSON equals the original
+    """
+    # Given
+    source = str(tmp_path / "users.json")
+    users = [make_user(str(i)) for i in range(100)]
+    storage.FileStorage(source).replace_all(users)
+
+    # When
+    storage.convert_file(source, str(tmp_path / "users.udb"), "binary")
+    storage.convert_file(str(tmp_path / "users.udb"), str(tmp_path / "back.json"), "json")
+
+    # Then
+    assert os.path.getsize(tmp_path / "users.udb") < os.path.getsize(source) / 2
+    with open(source, "rb") as a, open(tmp_path / "back.json", "rb") as b:
+        assert a.read() == b.read()
+
+
+# ──────────────────────────────────────────────
+# TEST: NUL characters cannot be stored in binary format
+# ──────────────────────────────────────────────
+def test_binary_format_rejects_nul_character(tmp_path):
+    """
+    GIVEN: A user whose address contains a NUL character
+    WHEN:  We write it in binary format
+    THEN:  A ValueError is raised
+    """
+    with pytest.raises(ValueError):
+        storage.FileStorage(str(tmp_path / "users.udb"), file_format="binary").replace_all(
+            [make_user("1", address="Park\0vej")]
+        )
+
+
+def test_binary_format_rejects_mixed_id_types(tmp_path):
+    """
+    GIVEN: Users with an int and a str person_id
+    WHEN:  We write them in binary format
+    THEN:  A ValueError is raised instead of turning every id into a string
+    """
+    with pytest.raises(ValueError):
+        storage.FileStorage(str(tmp_path / "users.udb"), file_format="binary").replace_all(
+            [make_user(1), make_user("2")]
+        )
+
+
+# ──────────────────────────────────────────────
+# TEST: Memory-mapped lookups in the indexed format
+# ──────────────────────────────────────────────
+def test_mapped_users_lookup_and_iteration(tmp_path):
+    """
+    GIVEN: An indexed file with int and string ids, written in random order
+    WHEN:  It is opened with MappedUsers
+    THEN:  get() finds each user (and None for a missing id), and iteration is ordered by id
+    """
+    # Given
+    users = [make_user(pid, address="Ærøvej") for pid in [30, "b", 2, "a", 100]]
+    users[2]["enabled"] = False
+    path = str(tmp_path / "users.udx")
+    storage.FileStorage(path, file_format="indexed").replace_all(users)
+
+    # When
+    with mapped_store.MappedUsers(path) as mapped:
+        found = {user["person_id"]: mapped.get(user["person_id"]) for user in users}
+        missing = mapped.get(3)
+        order = [record.person_id for record in mapped]
+        count = len(mapped)
+
+    # Then
+    assert all(found[user["person_id"]] == user for user in users)
+    assert found[2].enabled is False and found[2]["address"] == "Ærøvej"
+    assert missing is None
+    assert order == [2, 30, 100, "a", "b"]
+    assert count == 5
+
+
+def test_mapped_users_rejects_other_formats(tmp_path):
+    """
+    GIVEN: A JSON user file
+    WHEN:  It is opened with MappedUsers
+    THEN:  A ValueError is raised
+    """
+    path = str(tmp_path / "users.json")
+    storage.FileStorage(path).replace_all([make_user("1")])
+
+    with pytest.raises(ValueError):
+        mapped_store.MappedUsers(path)
+
+
+# ──────────────────────────────────────────────
+# TEST: Sharded backend
+# ──────────────────────────────────────────────
+def test_sharded_save_only_rewrites_touched_shard(tmp_path):
+    """
+    GIVEN: A sharded folder with 4 shards and 40 users
+    WHEN:  One user is changed
+    THEN:  Only that user's shard file is rewritten, and get() reads it back
+    """
+    # Given
+    sharded = storage.open_storage("sharded", str(tmp_path / "shards"), shards=4)
+    sharded.replace_all([make_user(str(i)) for i in range(40)])
+    shard_paths = [sharded.shard_path(i) for i in range(4)]
+    before = [storage.stat_stamp(path) for path in shard_paths]
+
+    # When
+    changed = make_user("7", address="Skovvej")
+    sharded.save(lambda: [], changed=[changed])
+
+    # Then
+    touched = storage.shard_of("7", 4)
+    after = [storage.stat_stamp(path) for path in shard_paths]
+    assert [i for i in range(4) if before[i] != after[i]] == [touched]
+    assert sharded.get("7") == changed
+    assert len(sharded.load_all()) == 40
+
+
+def test_reshard_keeps_every_user(tmp_path):
+    """
+    GIVEN: A sharded folder with 2 shards and 50 users
+    WHEN:  It is resharded to 5 shards and a user is deleted
+    THEN:  Every user is found in its new shard and the old shard files are gone
+    """
+    # Given
+    path = str(tmp_path / "shards")
+    users = [make_user(str(i)) for i in range(50)]
+    storage.open_storage("sharded", path, shards=2).replace_all(users)
+
+    # When
+    moved = storage.reshard(path, 5)
+    sharded = storage.ShardedStorage(path)
+    sharded.save(lambda: [], deleted=["3"])
+
+    # Then
+    assert moved == 50
+    assert sharded.shard_count() == 5
+    assert not [name for name in os.listdir(path) if "-of-002" in name]
+    assert sharded.get("3") is None
+    assert sorted(u["person_id"] for u in sharded.load_all()) == sorted(str(i) for i in range(50) if i != 3)
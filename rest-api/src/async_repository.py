@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Writes that arrive within this many seconds are saved together
+WRITE_COALESCE_WINDOW = 0.001
+
+
+class AsyncUserRepository:
+    # async wrapper around UserRepository for the async routes.
+    #
+    # Writes are queued and flushed by one dedicated writer thread: it takes
+    # every write that is waiting, applies them under one lock and persists
+    # them with a single save (group commit). While a flush runs, new writes
+    # queue up for the next one, so under load many writes share one file
+    # write instead of each rewriting users.json.
+    #
+    # Reads are served from memory; they run in the default executor because
+    # _refresh() may stat or reload the file. The queue uses threading
+    # primitives, so it works from any event loop (and from TestClient threads).
+
+    def __init__(self, repository, window=WRITE_COALESCE_WINDOW):
+        self.repository = repository
+        self.window = window
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-writer")
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self.flush_scheduled = False
+
+    def load(self):
+        self.repository.load()
+
+    def _submit(self, write):
+        future = Future()
+        with self.pending_lock:
+            self.pending.append((write, future))
+            start = not self.flush_scheduled
+            self.flush_scheduled = True
+        if start:
+            self.writer.submit(self._flush)
+        return future
+
+    def _flush(self):
+        # Runs in the writer thread
+        if self.window:
+            threading.Event().wait(self.window)
+        while True:
+            with self.pending_lock:
+                batch, self.pending = self.pending, []
+                if not batch:
+                    self.flush_scheduled = False
+                    return
+            try:
+                results = self.repository.apply_writes([write for write, _ in batch])
+            except BaseException as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+
+    async def _write(self, *write):
+        return await asyncio.wrap_future(self._submit(write))
+
+    async def _read(self, method, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: method(*args, **kwargs))
+
+    async def current_version(self):
+        return await self._read(self.repository.current_version)
+
+    async def get(self, person_id):
+        return await self._read(self.repository.get, person_id)
+
+    async def list(self):
+        return await self._read(self.repository.list)
+
+    async def query(self, **filters):
+        return await self._read(self.repository.query, **filters)
+
+    async def add(self, user):
+        return await self._write("add", user)
+
+    async def add_many(self, users):
+        return await self._write("add_many", users)
+
+    async def replace(self, person_id, user):
+        return await self._write("replace", person_id, user)
+
+    async def delete(self, person_id):
+        return await self._write("delete", person_id)
+
+    async def set_password_hash(self, person_id, old_hash, new_hash):
+        return await self._write("set_password_hash", person_id, old_hash, new_hash)
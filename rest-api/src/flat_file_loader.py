@@ -1,16 +1,134 @@
-import json
 import os
+import sys
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl, only the in-process lock is used there
+    fcntl = None
+
+# storage.py lives in the flat-file-db assignment and is shared with flat_file_db.py
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "flat-file-db", "src"))
+
+import changes  # noqa: E402
+import indexes  # noqa: E402
+import metrics  # noqa: E402  (crypto-hashing/src is put on the path by storage.py)
+import storage  # noqa: E402
+
+# Storage backend: "json" (DB_PATH), "sharded" (SHARD_PATH) or "sqlite" (SQLITE_PATH).
+# Chosen with the USER_STORAGE environment variable, e.g. USER_STORAGE=sqlite
+STORAGE_BACKEND = os.environ.get("USER_STORAGE", "json")
+
+# Format used when users.json is written: "json" (indent=4), "json-min" or "binary".
+# Reading detects the format. Chosen with USER_STORAGE_FORMAT
+FILE_FORMAT = os.environ.get("USER_STORAGE_FORMAT", "json")
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "db", "users.json")
+SQLITE_PATH = os.path.join(os.path.dirname(__file__), "..", "db", "users.db")
+
+# Folder with the shard files. USER_STORAGE_SHARDS is only used when it is created
+SHARD_PATH = os.path.join(os.path.dirname(__file__), "..", "db", "users-shards")
+SHARD_COUNT = int(os.environ.get("USER_STORAGE_SHARDS", "4"))
+
+# Change feed (GET /users/changes): every write is appended to CHANGES_PATH with a
+# sequence number (see changes.py). Off unless USER_CHANGE_FEED=1, because the log
+# is never truncated and grows with every write
+CHANGE_FEED = os.environ.get("USER_CHANGE_FEED", "") == "1"
+CHANGES_PATH = os.path.join(os.path.dirname(__file__), "..", "db", "users.changes.log")
+
+# Fields with a secondary index for UserRepository.query; the prefix fields take prefixes
+INDEXED_FIELDS = ("enabled", "last_name", "first_name")
+PREFIX_FIELDS = ("last_name", "first_name")
 
+# Open storage backends, keyed by (backend, path, pid)
+_storages = {}
 
+# Open change logs, keyed by path
+_change_logs = {}
+
+
+def get_storage():
+    if STORAGE_BACKEND == "sqlite":
+        key, options = ("sqlite", SQLITE_PATH), {}
+    elif STORAGE_BACKEND == "sharded":
+        key, options = ("sharded", SHARD_PATH), {"shards": SHARD_COUNT, "indent": 4, "file_format": FILE_FORMAT}
+    else:
+        key, options = ("json", DB_PATH), {"indent": 4, "file_format": FILE_FORMAT}
+    # Keyed by pid too: a forked worker must not reuse its parent's SQLite connection
+    cache_key = key + tuple(options.values()) + (os.getpid(),)
+    if cache_key not in _storages:
+        _storages[cache_key] = storage.open_storage(*key, **options)
+    return _storages[cache_key]
+
+
+@metrics.timed("load_users")
 def load_users():
-    if not os.path.exists(DB_PATH):
-        return []
-    with open(DB_PATH, "r") as f:
-        return json.load(f)
+    return get_storage().load_all()
 
 
+@metrics.timed("save_users")
 def save_users(users):
-    with open(DB_PATH, "w") as f:
-        json.dump(users, f, indent=4)
\ No newline at end of file
+    # JSON: written to a temp file and moved over users.json, so a crash or a
+    # concurrent reader never sees a truncated file
+    get_storage().replace_all(users)
+
+
+@metrics.timed("save_changes")
+def save_changes(snapshot, changed=(), deleted=()):
+    # snapshot() returns all users (used by the JSON file), changed/deleted
+    # are the rows that differ (used by SQLite, which only writes those rows)
+    get_storage().save(snapshot, changed, deleted)
+
+
+def get_change_log():
+    if CHANGES_PATH not in _change_logs:
+        _change_logs[CHANGES_PATH] = changes.ChangeLog(CHANGES_PATH)
+    return _change_logs[CHANGES_PATH]
+
+
+def build_indexes(users):
+    # field -> indexes.SecondaryIndex over users, kept up to date by the caller
+    return indexes.build_indexes(INDEXED_FIELDS, users, PREFIX_FIELDS)
+
+
+def classify_change(old, new):
+    # "create", "update", "enable" or "disable" for a change from old to new
+    return changes.classify(old, new)
+
+
+def change_feed_enabled():
+    return CHANGE_FEED
+
+
+def append_changes(events):
+    # events is a list of (op, user) pairs, e.g. ("create", user). Skipped when the feed is off
+    if CHANGE_FEED:
+        get_change_log().append(events)
+
+
+def read_changes(since=0, limit=None):
+    return get_change_log().read(since, limit)
+
+
+def last_change_seq():
+    return get_change_log().last_seq()
+
+
+def file_stamp():
+    # Changes whenever another process writes, used to detect writes from other workers
+    return get_storage().stamp()
+
+
+@contextmanager
+def file_lock():
+    # Advisory lock on users.json.lock (users.db.lock, users-shards.lock), shared by every
+    # process (uvicorn worker) that uses the same database
+    if fcntl is None:
+        yield
+        return
+    with open(get_storage().path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -1,65 +1,312 @@
-from fastapi import FastAPI, HTTPException
-from src.models import User
-from src.flat_file_loader import load_users, save_users
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
-app = FastAPI()
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from src.async_repository import AsyncUserRepository
+from src.flat_file_loader import change_feed_enabled, last_change_seq, metrics, read_changes
+from src.metrics_middleware import MetricsMiddleware
+from src.models import LoginRequest, PublicUser, User
+from src.passwords import (
+    hash_password_async,
+    is_password_hash,
+    needs_rehash,
+    verify_dummy_password_async,
+    verify_password_async,
+)
+from src.repository import UserRepository
+from src.response_cache import ResponseCache
+
+# Async routes use the async wrapper, which coalesces concurrent writes into one save
+repository = AsyncUserRepository(UserRepository())
+
+# Serialized GET /users and GET /users/{person_id} bodies, per repository version
+response_cache = ResponseCache()
+
+# POST /users/bulk validates, hashes and saves this many rows at a time
+BULK_CHUNK_SIZE = 500
+
+# GET /users/stream and /users/export serialize this many users per chunk
+EXPORT_CHUNK_SIZE = 1000
+
+# GET /users/export?password_hashes=true (a backup with the stored bcrypt hashes)
+# is refused unless the server is started with USER_EXPORT_HASHES=1
+EXPORT_PASSWORD_HASHES = os.environ.get("USER_EXPORT_HASHES", "") == "1"
+
+# How often /users/changes checks the change log while it waits for new changes
+CHANGES_POLL_INTERVAL = 0.1
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Load users.json once at startup, routes then read from memory
+    repository.load()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "REST API is running"}
 
 
-@app.post("/users")
-def create_user(user: User):
-    users = load_users()
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text format. Collection is off unless USER_METRICS=1
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/users", response_model=PublicUser)
+async def create_user(user: User):
+    # bcrypt runs in the crypto_utils worker pool, the file write in the writer thread
+    data = user.dict()
+    data["password"] = await hash_password_async(user.password)
 
-    # Check if user already exists
-    if any(u["person_id"] == user.person_id for u in users):
+    # add() checks for an existing user under the same lock as the write
+    if not await repository.add(data):
         raise HTTPException(status_code=400, detail="User already exists")
 
-    users.append(user.dict())
-    save_users(users)
+    return data
+
+
+async def _ndjson(users, model=PublicUser):
+    # NDJSON: one user per line (as model), serialized EXPORT_CHUNK_SIZE users at a
+    # time, so the whole table is never built as one response in memory
+    for start in range(0, len(users), EXPORT_CHUNK_SIZE):
+        yield "".join(
+            json.dumps(model(**user).dict()) + "\n" for user in users[start:start + EXPORT_CHUNK_SIZE]
+        )
+
+
+@app.get("/users/stream")
+async def stream_users():
+    return StreamingResponse(_ndjson(await repository.list()), media_type="application/x-ndjson")
+
+
+@app.get("/users/export")
+async def export_users(password_hashes: bool = Query(False)):
+    # NDJSON file download of all users, without passwords like every other response.
+    # With password_hashes=true (only if EXPORT_PASSWORD_HASHES is on) each row is a
+    # full User with the stored bcrypt hash, a backup that POST /users/bulk can read
+    # back as is (see _hash_unless_hashed)
+    if password_hashes and not EXPORT_PASSWORD_HASHES:
+        raise HTTPException(status_code=403, detail="Export of password hashes is disabled")
+    return StreamingResponse(
+        _ndjson(await repository.list(), User if password_hashes else PublicUser),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="users.ndjson"'},
+    )
+
+
+async def _ndjson_rows(request):
+    # (line number, text) for each non-empty line of the request body, read as it arrives
+    buffer = b""
+    number = 0
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield number, line
+    if buffer.strip():
+        yield number + 1, buffer
+
+
+def _validation_message(error):
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors())
+
+
+async def _hash_unless_hashed(password):
+    # Rows that already carry a bcrypt hash (e.g. restored from a backup) are kept as is
+    if is_password_hash(password):
+        return password
+    return await hash_password_async(password)
+
+
+async def _import_chunk(rows):
+    # Validate rows with the User model, hash the passwords and add them in one write.
+    # Returns (number created, list of per-row errors)
+    errors = []
+    valid = []
+    for line, text in rows:
+        try:
+            valid.append((line, User(**json.loads(text)).dict()))
+        except ValueError as e:  # invalid JSON, or a pydantic ValidationError
+            message = _validation_message(e) if isinstance(e, ValidationError) else "Invalid JSON"
+            errors.append({"line": line, "person_id": None, "error": message})
+        except TypeError:
+            errors.append({"line": line, "person_id": None, "error": "Row must be a JSON object"})
+
+    hashes = await asyncio.gather(*(_hash_unless_hashed(user["password"]) for _, user in valid))
+    for (_, user), hashed in zip(valid, hashes):
+        user["password"] = hashed
+
+    results = await repository.add_many([user for _, user in valid]) if valid else []
+    for (line, user), added in zip(valid, results):
+        if not added:
+            errors.append({"line": line, "person_id": user["person_id"], "error": "User already exists"})
+    return sum(results), errors
+
+
+@app.post("/users/bulk")
+async def bulk_create_users(request: Request):
+    # NDJSON body with one User per line. Rows are handled BULK_CHUNK_SIZE at a
+    # time: validated, hashed and saved with one write per chunk. Bad rows and
+    # duplicates are reported per line and do not stop the import
+    created = 0
+    errors = []
+    chunk = []
+    async for row in _ndjson_rows(request):
+        chunk.append(row)
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            chunk_created, chunk_errors = await _import_chunk(chunk)
+            created += chunk_created
+            errors.extend(chunk_errors)
+            chunk = []
+    if chunk:
+        chunk_created, chunk_errors = await _import_chunk(chunk)
+        created += chunk_created
+        errors.extend(chunk_errors)
+
+    errors.sort(key=lambda error: error["line"])
+    return {"created": created, "failed": len(errors), "errors": errors}
+
+
+@app.get("/users/changes")
+async def user_changes(
+    request: Request,
+    since: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    timeout: Optional[float] = Query(None, ge=0),
+    last_event_id: Optional[int] = Header(None),
+):
+    # Change feed with seq > since, so a consumer syncs incrementally instead of
+    # re-reading GET /users. With "Accept: text/event-stream" the changes are sent
+    # as Server-Sent Events (resumed from the Last-Event-ID header); otherwise one
+    # JSON page is returned, waiting up to timeout seconds for a change (long-poll).
+    # 404 unless the feed is turned on with USER_CHANGE_FEED=1
+    if not change_feed_enabled():
+        raise HTTPException(status_code=404, detail="Change feed is disabled")
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        start = last_event_id if last_event_id is not None else since
+        return StreamingResponse(_change_events(request, start, timeout), media_type="text/event-stream")
+
+    deadline = time.monotonic() + (timeout or 0)
+    entries = await run_in_threadpool(read_changes, since, limit)
+    while not entries and time.monotonic() < deadline:
+        await asyncio.sleep(CHANGES_POLL_INTERVAL)
+        entries = await run_in_threadpool(read_changes, since, limit)
+
+    return {"changes": entries, "last_seq": await run_in_threadpool(last_change_seq)}
+
+
+async def _change_events(request, since, timeout):
+    # SSE stream: "id" is the seq, "event" the op. Ends when the client disconnects,
+    # or after timeout seconds without a change (the client then reconnects)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not await request.is_disconnected():
+        entries = await run_in_threadpool(read_changes, since)
+        for entry in entries:
+            since = entry["seq"]
+            yield f"id: {entry['seq']}\nevent: {entry['op']}\ndata: {json.dumps(entry)}\n\n"
+        if entries and timeout is not None:
+            deadline = time.monotonic() + timeout
+        if deadline is not None and time.monotonic() >= deadline:
+            return
+        await asyncio.sleep(CHANGES_POLL_INTERVAL)
+
+
+@app.post("/login", response_model=PublicUser)
+async def login(credentials: LoginRequest):
+    user = await repository.get(credentials.person_id)
+    # Same answer for unknown user, disabled user and wrong password. bcrypt runs
+    # against a dummy hash in the first two cases, so the timing is the same too
+    if user is None or not user["enabled"] or not is_password_hash(user["password"]):
+        await verify_dummy_password_async(credentials.password)
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    if not await verify_password_async(credentials.password, user["password"]):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    # Upgrade hashes made with a lower bcrypt cost than the current target
+    if needs_rehash(user["password"]):
+        new_hash = await hash_password_async(credentials.password)
+        await repository.set_password_hash(user["person_id"], user["password"], new_hash)
 
     return user
 
 
-@app.get("/users/{person_id}")
-def get_user(person_id: int):
-    users = load_users()
+def _to_json(data):
+    # Same compact JSON as FastAPI's JSONResponse
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
-    for user in users:
-        if user["person_id"] == person_id:
-            return user
 
-    raise HTTPException(status_code=404, detail="User not found")
+@app.get("/users/{person_id}", response_model=PublicUser)
+async def get_user(person_id: int, if_none_match: Optional[str] = Header(None)):
+    # ETag is a hash of the body; If-None-Match with the current ETag gets 304
+    version, modified = await repository.current_version()
 
+    async def build():
+        user = await repository.get(person_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return _to_json(PublicUser(**user).dict())
 
-@app.put("/users/{person_id}")
-def update_user(person_id: int, updated_user: User):
-    users = load_users()
+    return await response_cache.respond(("user", person_id), version, modified, if_none_match, build)
 
-    for index, user in enumerate(users):
-        if user["person_id"] == person_id:
-            users[index] = updated_user.dict()
-            save_users(users)
-            return updated_user
 
-    raise HTTPException(status_code=404, detail="User not found")
+@app.put("/users/{person_id}", response_model=PublicUser)
+async def update_user(person_id: int, updated_user: User):
+    # The person_id cannot be changed: a different id in the body could overwrite another user
+    if updated_user.person_id != person_id:
+        raise HTTPException(status_code=400, detail="person_id in the body must match the URL")
+
+    data = updated_user.dict()
+    data["password"] = await hash_password_async(updated_user.password)
+
+    if not await repository.replace(person_id, data):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return data
+
 
 @app.delete("/users/{person_id}")
-def delete_user(person_id: int):
-    users = load_users()
+async def delete_user(person_id: int):
+    deleted_user = await repository.delete(person_id)
+    if deleted_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    return {"message": "User deleted", "user": PublicUser(**deleted_user)}
 
-    for index, user in enumerate(users):
-        if user["person_id"] == person_id:
-            deleted_user = users.pop(index)
-            save_users(users)
-            return {"message": "User deleted", "user": deleted_user}
 
-    raise HTTPException(status_code=404, detail="User not found")
+@app.get("/users", response_model=List[PublicUser])
+async def list_users(
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    enabled: Optional[bool] = None,
+    last_name: Optional[str] = None,
+    first_name: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    # last_name and first_name are prefix filters.
+    # The serialized page is cached per version of the users and query
+    filters = {"enabled": enabled, "last_name": last_name, "first_name": first_name, "offset": offset, "limit": limit}
+    version, modified = await repository.current_version()
 
+    async def build():
+        users = await repository.query(**filters)
+        return _to_json([PublicUser(**user).dict() for user in users])
 
-@app.get("/users")
-def list_users():
-    return load_users()
\ No newline at end of file
+    key = ("list",) + tuple(filters.values())
+    return await response_cache.respond(key, version, modified, if_none_match, build)
\ No newline at end of file
@@ -0,0 +1,15 @@
+# Hashes every password in users.json that is still stored in plaintext.
+#
+# Run from the rest-api folder:
+#     python -m src.migrate_passwords
+
+from src.repository import UserRepository
+
+
+def main():
+    migrated = UserRepository().migrate_plaintext_passwords()
+    print(f"Migrated {migrated} plaintext password(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,4 +9,19 @@ class User(BaseModel):
     address: str
     street_number: str
     password: str
-    enabled: bool = True
\ No newline at end of file
+    enabled: bool = True
+
+
+class PublicUser(BaseModel):
+    # User as returned by the API, without the password (hash)
+    person_id: int
+    first_name: str
+    last_name: str
+    address: str
+    street_number: str
+    enabled: bool = True
+
+
+class LoginRequest(BaseModel):
+    person_id: int
+    password: str
\ No newline at end of file
@@ -0,0 +1,16 @@
+import os
+import sys
+
+# crypto_utils lives in the crypto-hashing assignment
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "crypto-hashing", "src"))
+
+import crypto_utils  # noqa: E402
+from crypto_utils import (  # noqa: E402
+    hash_password_async,
+    hash_passwords,
+    invalidate_verify_cache,
+    is_password_hash,
+    needs_rehash,
+    verify_dummy_password_async,
+    verify_password_async,
+)
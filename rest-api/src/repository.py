@@ -0,0 +1,247 @@
+import itertools
+import threading
+import time
+
+from src.flat_file_loader import (
+    append_changes,
+    build_indexes,
+    classify_change,
+    file_lock,
+    file_stamp,
+    load_users,
+    save_changes,
+)
+from src.passwords import hash_passwords, invalidate_verify_cache, is_password_hash
+
+
+# Version numbers are unique across all repositories in the process,
+# so a cache keyed by version never mixes up two repositories
+_versions = itertools.count(1)
+
+
+class UserRepository:
+    # Holds all users in memory keyed by person_id.
+    # Reads are served from memory, writes go through to the JSON file.
+    #
+    # Every read-modify-write runs under a threading.Lock (FastAPI runs sync
+    # routes in a threadpool) and an fcntl file lock (several uvicorn workers
+    # can share users.json). Inside the lock the file is reloaded first if
+    # another process has changed it, so no write is lost.
+    #
+    # Every write is also appended to the change feed as (op, user) events,
+    # still inside the lock so the sequence numbers follow the write order.
+
+    def __init__(self):
+        self.users = {}
+        self.stamp = None
+        self.loaded = False
+        self.lock = threading.Lock()
+        # field -> SecondaryIndex for query(), rebuilt on reload and updated by every write
+        self.indexes = build_indexes([])
+        # Changes every time the users change (reload or save), with the time it happened
+        self.version = next(_versions)
+        self.modified = time.time()
+
+    def load(self):
+        with self.lock:
+            self._reload()
+
+    def _reload(self):
+        self.users = {user["person_id"]: user for user in load_users()}
+        self.indexes = build_indexes(self.users.values())
+        self.stamp = file_stamp()
+        self.loaded = True
+        self._bump_version()
+
+    def _refresh(self):
+        if not self.loaded or file_stamp() != self.stamp:
+            self._reload()
+
+    def _save(self, changed=(), deleted=(), events=()):
+        save_changes(lambda: list(self.users.values()), changed, deleted)
+        self.stamp = file_stamp()
+        self._bump_version()
+        append_changes(list(events) or [("update", user) for user in changed])
+
+    def _bump_version(self):
+        self.version = next(_versions)
+        self.modified = time.time()
+
+    def current_version(self):
+        # (version, modified time) of the users as they are now, for ETag/Last-Modified
+        with self.lock:
+            self._refresh()
+            return self.version, self.modified
+
+    def _read(self):
+        with self.lock:
+            self._refresh()
+            return self.users
+
+    def get(self, person_id):
+        return self._read().get(person_id)
+
+    def list(self):
+        return list(self._read().values())
+
+    def query(self, enabled=None, last_name=None, first_name=None, offset=0, limit=None):
+        # Filter users (last_name/first_name are prefixes) and return one page.
+        # The candidates come from one secondary index (last_name, else first_name,
+        # else enabled), so only the matching users are checked against the other filters.
+        with self.lock:
+            self._refresh()
+            if last_name is not None:
+                candidates = self.indexes["last_name"].find_prefix(last_name)
+            elif first_name is not None:
+                candidates = self.indexes["first_name"].find_prefix(first_name)
+            elif enabled is not None:
+                candidates = self.indexes["enabled"].find(enabled)
+            else:
+                candidates = self.users
+
+            page = []
+            skipped = 0
+            for person_id in candidates:
+                user = self.users[person_id]
+                if enabled is not None and user["enabled"] != enabled:
+                    continue
+                if first_name is not None and not user["first_name"].startswith(first_name):
+                    continue
+                if skipped < offset:
+                    skipped += 1
+                    continue
+                if limit is not None and len(page) >= limit:
+                    break
+                page.append(user)
+            return page
+
+    def apply_writes(self, writes):
+        # Apply a batch of writes, e.g. [("add", user), ("delete", person_id)],
+        # under one lock and persist them with a single save. Returns one result
+        # per write (see add/replace/delete/set_password_hash below).
+        with self.lock, file_lock():
+            self._refresh()
+            results = []
+            final = {}  # person_id -> latest user, or None if deleted
+            events = []
+            for kind, *args in writes:
+                result, changed, deleted, write_events = getattr(self, "_write_" + kind)(*args)
+                results.append(result)
+                for person_id in deleted:
+                    final[person_id] = None
+                for user in changed:
+                    final[user["person_id"]] = user
+                events.extend(write_events)
+            if final:
+                try:
+                    self._save(
+                        changed=[user for user in final.values() if user is not None],
+                        deleted=[person_id for person_id, user in final.items() if user is None],
+                        events=events,
+                    )
+                except BaseException:
+                    # Memory may now differ from the file, reload on the next access
+                    self.loaded = False
+                    raise
+            return results
+
+    def _index_add(self, user):
+        for index in self.indexes.values():
+            index.add(user)
+
+    def _index_remove(self, user):
+        for index in self.indexes.values():
+            index.remove(user)
+
+    def _write_add(self, user):
+        # False if a user with the same person_id already exists
+        if user["person_id"] in self.users:
+            return False, [], [], []
+        self._index_add(user)
+        self.users[user["person_id"]] = user
+        return True, [user], [], [("create", user)]
+
+    def _write_add_many(self, users):
+        # One result per user: False for a person_id that already exists
+        # (in the repository or earlier in the list)
+        results = []
+        added = []
+        for user in users:
+            if user["person_id"] in self.users:
+                results.append(False)
+                continue
+            self._index_add(user)
+            self.users[user["person_id"]] = user
+            added.append(user)
+            results.append(True)
+        return results, added, [], [("create", user) for user in added]
+
+    def _write_replace(self, person_id, user):
+        # False if the user does not exist, or if the body has another person_id
+        # (changing the id could overwrite another user, so it is not allowed)
+        if person_id not in self.users or user["person_id"] != person_id:
+            return False, [], [], []
+        old_user = self.users[person_id]
+        invalidate_verify_cache(old_user["password"])
+        self._index_remove(old_user)
+        self._index_add(user)
+        self.users[person_id] = user
+        return True, [user], [], [(classify_change(old_user, user), user)]
+
+    def _write_delete(self, person_id):
+        # The deleted user, or None if it did not exist
+        if person_id not in self.users:
+            return None, [], [], []
+        deleted_user = self.users.pop(person_id)
+        self._index_remove(deleted_user)
+        invalidate_verify_cache(deleted_user["password"])
+        return deleted_user, [], [person_id], [("delete", deleted_user)]
+
+    def _write_set_password_hash(self, person_id, old_hash, new_hash):
+        # Compare-and-set, used to upgrade a hash after login.
+        # False if the user or its hash changed in the meantime.
+        user = self.users.get(person_id)
+        if user is None or user["password"] != old_hash:
+            return False, [], [], []
+        self.users[person_id] = dict(user, password=new_hash)
+        invalidate_verify_cache(old_hash)
+        return True, [self.users[person_id]], [], [("update", self.users[person_id])]
+
+    def add(self, user):
+        return self.apply_writes([("add", user)])[0]
+
+    def add_many(self, users):
+        return self.apply_writes([("add_many", users)])[0]
+
+    def replace(self, person_id, user):
+        return self.apply_writes([("replace", person_id, user)])[0]
+
+    def delete(self, person_id):
+        return self.apply_writes([("delete", person_id)])[0]
+
+    def set_password_hash(self, person_id, old_hash, new_hash):
+        return self.apply_writes([("set_password_hash", person_id, old_hash, new_hash)])[0]
+
+    def migrate_plaintext_passwords(self, batch_size=100):
+        # Hash plaintext passwords batch by batch. Each batch is hashed in the
+        # crypto_utils worker pool outside the lock, then saved under the lock.
+        with self.lock:
+            self._refresh()
+            person_ids = [pid for pid, u in self.users.items() if not is_password_hash(u["password"])]
+
+        migrated = 0
+        for start in range(0, len(person_ids), batch_size):
+            batch = [(pid, self.get(pid)) for pid in person_ids[start:start + batch_size]]
+            batch = [(pid, user) for pid, user in batch if user is not None]
+            hashes = hash_passwords([user["password"] for _, user in batch])
+            with self.lock, file_lock():
+                self._refresh()
+                changed = []
+                for (pid, user), hashed in zip(batch, hashes):
+                    # Skip users that were changed while we were hashing
+                    if self.users.get(pid, {}).get("password") == user["password"]:
+                        self.users[pid] = dict(self.users[pid], password=hashed)
+                        changed.append(self.users[pid])
+                self._save(changed=changed)
+                migrated += len(changed)
+        return migrated
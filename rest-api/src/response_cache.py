@@ -0,0 +1,72 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+
+from fastapi.responses import Response
+from src.flat_file_loader import metrics
+
+# Max number of pre-serialized responses kept (e.g. one per distinct query)
+RESPONSE_CACHE_SIZE = 1024
+
+
+def make_etag(body):
+    # Strong ETag from the content, so every worker gives the same ETag for the same data
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match may hold "*" or a comma separated list of (weak) ETags
+    if if_none_match is None:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    # Pre-serialized JSON response bodies keyed by (request key, repository version).
+    # A body is serialized once per version; later requests reuse the bytes and
+    # the ETag, and a matching If-None-Match gets a 304 without serializing anything.
+
+    def __init__(self, size=RESPONSE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()  # key -> (version, etag, body)
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def lookup(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def store(self, key, version, body):
+        entry = (version, make_etag(body), body)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return entry
+
+    async def respond(self, key, version, modified, if_none_match, build):
+        # build() is an async function returning the body bytes; it is only
+        # called when there is no cached body for this version
+        entry = self.lookup(key, version)
+        metrics.record_cache("response", entry is not None)
+        if entry is None:
+            entry = self.store(key, version, await build())
+        _, etag, body = entry
+
+        headers = {"ETag": etag, "Last-Modified": formatdate(modified, usegmt=True)}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,38 @@
+"""
+Shared fixtures for the rest-api tests.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the rest-api folder to the path so we can import the src package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src import flat_file_loader, main, passwords
+from src.async_repository import AsyncUserRepository
+from src.repository import UserRepository
+
+
+@pytest.fixture(params=["json", "sharded", "sqlite"])
+def temp_db(request, tmp_path, monkeypatch):
+    """
+    Point the API at an empty database (JSON file, shard files or SQLite) in a temp folder.
+    Returns (backend, db_path, sqlite_path, shard_path, changes_path).
+    """
+    db_path = tmp_path / "users.json"
+    db_path.write_text("[]")
+    monkeypatch.setattr(flat_file_loader, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(flat_file_loader, "DB_PATH", str(db_path))
+    monkeypatch.setattr(flat_file_loader, "SQLITE_PATH", str(tmp_path / "users.db"))
+    monkeypatch.setattr(flat_file_loader, "SHARD_PATH", str(tmp_path / "users-shards"))
+    monkeypatch.setattr(flat_file_loader, "CHANGES_PATH", str(tmp_path / "users.changes.log"))
+    monkeypatch.setattr(flat_file_loader, "CHANGE_FEED", True)
+    monkeypatch.setattr(main, "repository", AsyncUserRepository(UserRepository()))
+    # Lowest bcrypt cost so the tests run fast
+    monkeypatch.setattr(passwords.crypto_utils, "BCRYPT_ROUNDS", 4)
+    return (
+        request.param, str(db_path), str(tmp_path / "users.db"),
+        str(tmp_path / "users-shards"), str(tmp_path / "users.changes.log"),
+    )
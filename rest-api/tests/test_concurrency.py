@@ -0,0 +1,156 @@
+"""
+Load tests for concurrent writes in the REST API.
+
+Many writers hit the API (threads) or the repository (processes) at the
+same time. No write may be lost.
+Uses Given / When / Then comments to describe each test scenario.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# Add the rest-api folder to the path so we can import the src package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.testclient import TestClient
+
+from src import flat_file_loader, main
+from src import repository as repository_module
+from src.async_repository import AsyncUserRepository
+from src.repository import UserRepository
+
+WRITERS = 120
+
+
+def make_user(person_id):
+    return {
+        "person_id": person_id,
+        "first_name": "Anders",
+        "last_name": "Jensen",
+        "address": "Parkvej",
+        "street_number": "12",
+        "password": "hemmeligt123",
+        "enabled": True,
+    }
+
+
+def add_users_in_process(db, person_ids):
+    """Runs in a child process, like a separate uvicorn worker."""
+    (flat_file_loader.STORAGE_BACKEND, flat_file_loader.DB_PATH, flat_file_loader.SQLITE_PATH,
+     flat_file_loader.SHARD_PATH, flat_file_loader.CHANGES_PATH) = db
+    repository = UserRepository()
+    for person_id in person_ids:
+        repository.add(make_user(person_id))
+
+
+# ──────────────────────────────────────────────
+# TEST: Concurrent POSTs do not lose users
+# ──────────────────────────────────────────────
+def test_concurrent_posts_lose_no_users(temp_db):
+    """
+    GIVEN: An empty database
+    WHEN:  120 clients POST a new user at the same time
+    THEN:  Every request succeeds and all 120 users are stored
+    """
+    # Given
+    client = TestClient(main.app)
+
+    # When
+    with ThreadPoolExecutor(max_workers=WRITERS) as pool:
+        responses = list(pool.map(lambda i: client.post("/users", json=make_user(i)), range(WRITERS)))
+
+    # Then
+    assert all(r.status_code == 200 for r in responses)
+    stored = flat_file_loader.load_users()
+    assert sorted(u["person_id"] for u in stored) == list(range(WRITERS))
+
+
+# ──────────────────────────────────────────────
+# TEST: Concurrent duplicate POSTs create only one user
+# ──────────────────────────────────────────────
+def test_concurrent_duplicate_posts_create_one_user(temp_db):
+    """
+    GIVEN: An empty database
+    WHEN:  120 clients POST the same person_id at the same time
+    THEN:  Exactly one request succeeds and the rest get HTTP 400
+    """
+    # Given
+    client = TestClient(main.app)
+
+    # When
+    with ThreadPoolExecutor(max_workers=WRITERS) as pool:
+        responses = list(pool.map(lambda i: client.post("/users", json=make_user(1)), range(WRITERS)))
+
+    # Then
+    codes = [r.status_code for r in responses]
+    assert codes.count(200) == 1
+    assert codes.count(400) == WRITERS - 1
+    assert len(flat_file_loader.load_users()) == 1
+
+
+# ──────────────────────────────────────────────
+# TEST: Several processes share the database safely
+# ──────────────────────────────────────────────
+@pytest.mark.skipif(flat_file_loader.fcntl is None, reason="fcntl file locks are not available on this platform.")
+def test_multiple_processes_lose_no_users(temp_db):
+    """
+    GIVEN: An empty database shared by 4 worker processes
+    WHEN:  Each process adds 30 users at the same time
+    THEN:  All 120 users are stored
+    """
+    # Given
+    workers = 4
+    per_worker = WRITERS // workers
+
+    # When
+    processes = [
+        multiprocessing.Process(
+            target=add_users_in_process,
+            args=(temp_db, range(w * per_worker, (w + 1) * per_worker)),
+        )
+        for w in range(workers)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+
+    # Then
+    assert all(p.exitcode == 0 for p in processes)
+    stored = flat_file_loader.load_users()
+    assert sorted(u["person_id"] for u in stored) == list(range(WRITERS))
+
+
+# ──────────────────────────────────────────────
+# TEST: Concurrent async writes share one save (group commit)
+# ──────────────────────────────────────────────
+def test_async_writes_are_coalesced(temp_db, monkeypatch):
+    """
+    GIVEN: The async repository and a counter on save_changes
+    WHEN:  50 users are added concurrently from one event loop
+    THEN:  All 50 are stored and change feed entries exist, with far fewer saves than writes
+    """
+    # Given
+    saves = []
+    original_save = repository_module.save_changes
+    monkeypatch.setattr(
+        repository_module, "save_changes", lambda *args, **kwargs: (saves.append(1), original_save(*args, **kwargs))
+    )
+    repository = AsyncUserRepository(UserRepository(), window=0.05)
+
+    async def add_all():
+        return await asyncio.gather(*(repository.add(make_user(i)) for i in range(50)))
+
+    # When
+    results = asyncio.run(add_all())
+
+    # Then
+    assert results == [True] * 50
+    assert len(UserRepository().list()) == 50
+    assert flat_file_loader.last_change_seq() == 50
+    assert len(saves) < 10
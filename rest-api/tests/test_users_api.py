@@ -0,0 +1,330 @@
+"""
+Tests for the /users endpoints in main.py.
+
+Uses Given / When / Then comments to describe each test scenario.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+# Add the rest-api folder to the path so we can import the src package
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.testclient import TestClient
+
+from src import flat_file_loader, main
+from src.flat_file_loader import metrics
+from src.async_repository import AsyncUserRepository
+from src.repository import UserRepository
+
+
+def make_user(person_id, first_name="Anders", last_name="Jensen", enabled=True):
+    return {
+        "person_id": person_id,
+        "first_name": first_name,
+        "last_name": last_name,
+        "address": "Parkvej",
+        "street_number": "12",
+        "password": "hemmeligt123",
+        "enabled": enabled,
+    }
+
+
+@pytest.fixture
+def client(temp_db):
+    """A TestClient on top of the empty database from the temp_db fixture (conftest.py)."""
+    return TestClient(main.app)
+
+
+# ──────────────────────────────────────────────
+# TEST: List users is filtered, paginated and hides passwords
+# ──────────────────────────────────────────────
+def test_list_users_filters_and_paginates(client):
+    """
+    GIVEN: Four users, three with a last name starting with 'Je'
+    WHEN:  We list enabled users with last_name prefix 'Je', one per page
+    THEN:  The second page holds the second match and no password is returned
+    """
+    # Given
+    client.post("/users", json=make_user(1, "Anders", "Jensen"))
+    client.post("/users", json=make_user(2, "Bo", "Jensen", enabled=False))
+    client.post("/users", json=make_user(3, "Carl", "Hansen"))
+    client.post("/users", json=make_user(4, "Dan", "Jeppesen"))
+
+    # When
+    response = client.get("/users", params={"last_name": "Je", "enabled": True, "limit": 1, "offset": 1})
+
+    # Then
+    assert response.status_code == 200
+    page = response.json()
+    assert [u["person_id"] for u in page] == [4]
+    assert "password" not in page[0]
+
+
+def test_list_users_filters_follow_updates_and_deletes(client):
+    """
+    GIVEN: Three users
+    WHEN:  One is renamed and disabled with PUT and another is deleted
+    THEN:  The last_name, first_name and enabled filters reflect the writes
+    """
+    # Given
+    client.post("/users", json=make_user(1, "Anders", "Jensen"))
+    client.post("/users", json=make_user(2, "Bo", "Hansen"))
+    client.post("/users", json=make_user(3, "Carl", "Jeppesen"))
+
+    # When
+    client.put("/users/2", json=make_user(2, "Bo", "Jessen", enabled=False))
+    client.delete("/users/1")
+
+    # Then
+    ids = lambda params: [u["person_id"] for u in client.get("/users", params=params).json()]
+    assert ids({"last_name": "Je"}) == [3, 2]
+    assert ids({"last_name": "Ha"}) == []
+    assert ids({"first_name": "Bo"}) == [2]
+    assert ids({"enabled": False}) == [2]
+    assert ids({"enabled": True}) == [3]
+
+
+def test_put_cannot_change_person_id(client):
+    """
+    GIVEN: Users 1 and 2 exist
+    WHEN:  PUT /users/1 is sent with person_id 2 in the body
+    THEN:  The request is rejected with 400 and both users are unchanged
+    """
+    # Given
+    client.post("/users", json=make_user(1, "Anders", "Jensen"))
+    client.post("/users", json=make_user(2, "Bo", "Hansen"))
+
+    # When
+    response = client.put("/users/1", json=make_user(2, "Carl", "Jeppesen"))
+
+    # Then
+    assert response.status_code == 400
+    main.repository.repository.loaded = False
+    assert client.get("/users/1").json()["first_name"] == "Anders"
+    assert client.get("/users/2").json()["first_name"] == "Bo"
+    assert [u["person_id"] for u in client.get("/users", params={"last_name": "Je"}).json()] == [1]
+
+
+# ──────────────────────────────────────────────
+# TEST: Streaming export as NDJSON
+# ──────────────────────────────────────────────
+def test_stream_users_as_ndjson(client):
+    """
+    GIVEN: Two users exist
+    WHEN:  We call GET /users/stream
+    THEN:  Each line is one user as JSON, without the password
+    """
+    # Given
+    client.post("/users", json=make_user(1))
+    client.post("/users", json=make_user(2))
+
+    # When
+    response = client.get("/users/stream")
+
+    # Then
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [u["person_id"] for u in lines] == [1, 2]
+    assert all("password" not in u for u in lines)
+
+
+# ──────────────────────────────────────────────
+# TEST: Passwords are hashed and login uses the hash
+# ──────────────────────────────────────────────
+def test_password_is_hashed_and_login_works(client):
+    """
+    GIVEN: A user is created through POST /users
+    WHEN:  We look at the stored user and log in with right and wrong passwords
+    THEN:  Only a bcrypt hash is stored, the response has no password,
+           and only the right password is accepted
+    """
+    # Given
+    response = client.post("/users", json=make_user(1))
+    assert "password" not in response.json()
+
+    # When
+    stored = flat_file_loader.load_users()
+    ok = client.post("/login", json={"person_id": 1, "password": "hemmeligt123"})
+    wrong = client.post("/login", json={"person_id": 1, "password": "forkert"})
+
+    # Then
+    assert stored[0]["password"].startswith("$2")
+    assert ok.status_code == 200
+    assert ok.json()["person_id"] == 1
+    assert wrong.status_code == 401
+
+
+# ──────────────────────────────────────────────
+# TEST: Change feed as JSON and as Server-Sent Events
+# ──────────────────────────────────────────────
+def test_change_feed_since_and_sse(client):
+    """
+    GIVEN: A user that is created, disabled and then deleted through the API
+    WHEN:  We read the change feed from the start, after the first change, and as SSE
+    THEN:  The changes come in order with increasing seq, since skips older ones,
+           no password is included and the SSE stream carries the same events
+    """
+    # Given
+    client.post("/users", json=make_user(1, "Anders", "Jensen"))
+    client.put("/users/1", json=make_user(1, "Anders", "Jensen", enabled=False))
+    client.delete("/users/1")
+
+    # When
+    feed = client.get("/users/changes", params={"since": 0}).json()
+    newer = client.get("/users/changes", params={"since": feed["changes"][0]["seq"]}).json()
+    sse = client.get("/users/changes", params={"timeout": 0}, headers={"Accept": "text/event-stream"})
+
+    # Then
+    assert [entry["op"] for entry in feed["changes"]] == ["create", "disable", "delete"]
+    assert [entry["seq"] for entry in feed["changes"]] == [1, 2, 3]
+    assert feed["last_seq"] == 3
+    assert all("password" not in entry["user"] for entry in feed["changes"])
+    assert [entry["op"] for entry in newer["changes"]] == ["disable", "delete"]
+    assert sse.headers["content-type"].startswith("text/event-stream")
+    assert "id: 3\nevent: delete\n" in sse.text
+
+
+def test_change_feed_can_be_turned_off(client, monkeypatch):
+    """
+    GIVEN: The change feed is turned off (the default without USER_CHANGE_FEED=1)
+    WHEN:  A user is created and GET /users/changes is called
+    THEN:  No change log is written and the endpoint answers 404
+    """
+    # Given
+    monkeypatch.setattr(flat_file_loader, "CHANGE_FEED", False)
+
+    # When
+    client.post("/users", json=make_user(1))
+    response = client.get("/users/changes")
+
+    # Then
+    assert response.status_code == 404
+    assert not os.path.exists(flat_file_loader.CHANGES_PATH)
+
+
+# ──────────────────────────────────────────────
+# TEST: ETag and If-None-Match
+# ──────────────────────────────────────────────
+def test_etag_returns_304_until_data_changes(client):
+    """
+    GIVEN: A stored user and the ETags of GET /users/1 and GET /users
+    WHEN:  The same requests are repeated with If-None-Match, then the user is changed
+    THEN:  The repeats get 304 with the same ETag, and after the change a new 200 with a new ETag
+    """
+    # Given
+    client.post("/users", json=make_user(1, "Anders", "Jensen"))
+    first = client.get("/users/1")
+    listing = client.get("/users", params={"enabled": True})
+
+    # When
+    not_modified = client.get("/users/1", headers={"If-None-Match": first.headers["etag"]})
+    list_not_modified = client.get("/users", params={"enabled": True}, headers={"If-None-Match": listing.headers["etag"]})
+    client.put("/users/1", json=make_user(1, "Anders", "Hansen"))
+    changed = client.get("/users/1", headers={"If-None-Match": first.headers["etag"]})
+
+    # Then
+    assert first.status_code == 200 and "last-modified" in first.headers
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == first.headers["etag"]
+    assert list_not_modified.status_code == 304
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != first.headers["etag"]
+    assert changed.json()["last_name"] == "Hansen"
+    assert "password" not in changed.json()
+
+
+# ──────────────────────────────────────────────
+# TEST: Bulk import and export as NDJSON
+# ──────────────────────────────────────────────
+def test_bulk_import_reports_row_errors_and_export_streams(client, monkeypatch):
+    """
+    GIVEN: An existing user and an NDJSON body with 5 new users, a duplicate,
+           a row with a missing field and a line that is not JSON
+    WHEN:  The body is posted to /users/bulk in chunks of 2 rows, and /users/export is read
+    THEN:  The 5 new users are created, the 3 bad rows are reported by line,
+           passwords are hashed and the export holds all 6 users without passwords
+    """
+    # Given
+    monkeypatch.setattr(main, "BULK_CHUNK_SIZE", 2)
+    client.post("/users", json=make_user(1, "Anders", "Jensen"))
+    rows = [json.dumps(make_user(i, "Bo", "Hansen")) for i in range(2, 7)]
+    rows.insert(2, json.dumps(make_user(1, "Bo", "Hansen")))
+    rows.insert(4, json.dumps({"person_id": 99, "first_name": "Bo"}))
+    rows.append("not json")
+    body = "\n".join(rows) + "\n"
+
+    # When
+    result = client.post("/users/bulk", content=body, headers={"Content-Type": "application/x-ndjson"}).json()
+    export = client.get("/users/export")
+
+    # Then
+    assert result["created"] == 5
+    assert [(error["line"], error["person_id"]) for error in result["errors"]] == [(3, 1), (5, None), (8, None)]
+    assert "last_name" in result["errors"][1]["error"]
+    assert main.repository.repository.get(4)["password"].startswith("$2")
+    exported = [json.loads(line) for line in export.text.splitlines()]
+    assert sorted(user["person_id"] for user in exported) == [1, 2, 3, 4, 5, 6]
+    assert all("password" not in user for user in exported)
+
+
+def test_export_with_hashes_can_be_imported_again(client, tmp_path, monkeypatch):
+    """
+    GIVEN: Two users, one of them disabled
+    WHEN:  A backup with password hashes is exported (refused until USER_EXPORT_HASHES is on)
+           and posted to /users/bulk on a new, empty database
+    THEN:  Both users are restored as they were and the enabled one can log in with the old password
+    """
+    # Given
+    client.post("/users", json=make_user(1, "Anders", "Jensen"))
+    client.post("/users", json=make_user(2, "Bo", "Hansen", enabled=False))
+    assert client.get("/users/export", params={"password_hashes": True}).status_code == 403
+    monkeypatch.setattr(main, "EXPORT_PASSWORD_HASHES", True)
+    export = client.get("/users/export", params={"password_hashes": True}).text
+    empty_db = tmp_path / "restored.json"
+    empty_db.write_text("[]")
+    monkeypatch.setattr(flat_file_loader, "DB_PATH", str(empty_db))
+    monkeypatch.setattr(flat_file_loader, "SQLITE_PATH", str(tmp_path / "restored.db"))
+    monkeypatch.setattr(flat_file_loader, "SHARD_PATH", str(tmp_path / "restored-shards"))
+    monkeypatch.setattr(main, "repository", AsyncUserRepository(UserRepository()))
+    assert client.get("/users").json() == []
+
+    # When
+    result = client.post("/users/bulk", content=export, headers={"Content-Type": "application/x-ndjson"}).json()
+
+    # Then
+    assert result == {"created": 2, "failed": 0, "errors": []}
+    assert client.get("/users/export", params={"password_hashes": True}).text == export
+    assert client.post("/login", json={"person_id": 1, "password": "hemmeligt123"}).status_code == 200
+
+
+# ──────────────────────────────────────────────
+# TEST: Prometheus metrics
+# ──────────────────────────────────────────────
+def test_metrics_endpoint_reports_routes_storage_and_caches(client, monkeypatch):
+    """
+    GIVEN: Metrics are enabled and reset
+    WHEN:  A user is created and read twice, and /metrics is scraped
+    THEN:  The output has route histograms, save timings, bcrypt timings and response cache hits
+    """
+    # Given
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    metrics.reset()
+
+    # When
+    client.post("/users", json=make_user(1, "Anders", "Jensen"))
+    client.get("/users/1")
+    client.get("/users/1")
+    response = client.get("/metrics")
+
+    # Then
+    text = response.text
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'userdb_http_request_duration_seconds_count{method="GET",route="/users/{person_id}",status="200"} 2' in text
+    assert 'userdb_operation_duration_seconds_count{operation="save_changes"} 1' in text
+    assert 'operation="hash_password_async"' in text
+    assert 'userdb_cache_requests_total{cache="response",result="hit"} 1' in text
+    assert 'userdb_cache_requests_total{cache="response",result="miss"} 1' in text